@@ -0,0 +1,76 @@
+"""
+Время хода NegamaxAI против бюджета AI_MOVE_BUDGET_MS на больших полях.
+
+Для каждого поля играется несколько партий: один ход делает NegamaxAI,
+ответ - случайный. Для каждого поля печатается задержка хода (p50/max).
+Если самый долгий ход превышает бюджет больше чем на --tolerance,
+скрипт завершается с кодом 1:
+
+    python -m benchmarks.ai_budget --boards 7x5 9x5 --budget-ms 200
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Optional
+
+from tictactoebot.ai import NegamaxAI
+from tictactoebot.bitboard import BitBoard, get_geometry
+from tictactoebot.config import AI_MOVE_BUDGET_MS
+
+
+def play(size: int, k: int, budget_ms: int, games: int, seed: int) -> list[float]:
+    """Задержки ходов NegamaxAI в миллисекундах"""
+    geometry = get_geometry(size, k)
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(games):
+        board = BitBoard(geometry=geometry)
+        while board.empty:
+            started = time.perf_counter()
+            move = NegamaxAI(board, budget_ms=budget_ms).move()
+            latencies.append((time.perf_counter() - started) * 1000)
+            board.play(move)
+            if geometry.is_win_at(board.opponent, move) or not board.empty:
+                break
+            reply = rng.choice(board.free_cells())
+            board.play(reply)
+            if geometry.is_win_at(board.opponent, reply):
+                break
+    return sorted(latencies)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ai_budget")
+    parser.add_argument("--boards", nargs="+", default=["5x4", "7x5", "9x5"],
+                        help="board size and k in a row, e.g. 7x5")
+    parser.add_argument("--budget-ms", type=int, default=AI_MOVE_BUDGET_MS)
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="allowed overshoot as a share of the budget")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    limit = args.budget_ms * (1 + args.tolerance)
+    results = {}
+    failed = False
+    for board in args.boards:
+        size, k = map(int, board.split("x"))
+        latencies = play(size, k, args.budget_ms, args.games, args.seed)
+        worst = latencies[-1]
+        results[board] = {
+            "moves": len(latencies),
+            "latency_p50_ms": round(latencies[len(latencies) // 2], 2),
+            "latency_max_ms": round(worst, 2),
+        }
+        failed = failed or worst > limit
+    print(json.dumps({"budget_ms": args.budget_ms, "boards": results}, indent=2))
+    if failed:
+        print(f"worst move exceeded {limit:.0f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
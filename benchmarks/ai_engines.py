@@ -0,0 +1,144 @@
+"""
+Бенчмарк движков ИИ на всех достижимых позициях 3x3.
+
+Для каждого движка считает узлы поиска, попадания в кэш, глубину,
+ходов в секунду, задержку хода (p50/p99/max) и долю оптимальных ходов.
+Результат - JSON, который можно сравнивать между коммитами:
+
+    python -m benchmarks.ai_engines --output before.json
+    python -m benchmarks.ai_engines --baseline before.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from functools import partial
+from typing import Callable, Optional
+
+from tictactoebot.ai import (
+    AI, AlphaBetaAI, MCTSAI, MiniMaxAI, NegamaxAI,
+    RandomAI, SearchStats, TablebaseAI, get_move_table,
+)
+from tictactoebot.bitboard import BitBoard, cell_bit, is_win
+from tictactoebot.enums import Difficulty
+
+
+ENGINES: dict[str, Callable[..., AI]] = {
+    "RandomAI": RandomAI,
+    "MiniMaxAI": MiniMaxAI,
+    "AlphaBetaAI": AlphaBetaAI,
+    "NegamaxAI": NegamaxAI,
+    "TablebaseAI": TablebaseAI,
+    "MCTSAI:easy": partial(MCTSAI, difficulty=Difficulty.EASY),
+    "MCTSAI:medium": partial(MCTSAI, difficulty=Difficulty.MEDIUM),
+    "MCTSAI:hard": partial(MCTSAI, difficulty=Difficulty.HARD),
+}
+DEFAULT_ENGINES = ["RandomAI", "MiniMaxAI", "AlphaBetaAI", "NegamaxAI", "MCTSAI:easy"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def positions(limit: Optional[int] = None, seed: int = 0) -> list[tuple[int, int]]:
+    """Все нетерминальные позиции, достижимые из пустого поля"""
+    keys = sorted(get_move_table())
+    if limit is not None and limit < len(keys):
+        keys = random.Random(seed).sample(keys, limit)
+    return keys
+
+
+def move_value(own: int, opponent: int, move: int) -> int:
+    """Результат хода move при идеальной игре (1, 0 или -1)"""
+    child_own = own | cell_bit(move)
+    if is_win(child_own):
+        return 1
+    if child_own | opponent == 0b111_111_111:
+        return 0
+    return -get_move_table()[(opponent, child_own)][0]
+
+
+def run_engine(name: str, keys: list[tuple[int, int]]) -> dict:
+    factory = ENGINES[name]
+    table = get_move_table()
+    # Таблица транспозиций общая для класса: каждый движок начинает с пустой
+    AlphaBetaAI.table.clear()
+    stats = SearchStats()
+    latencies = []
+    optimal = 0
+
+    started = time.perf_counter()
+    for own, opponent in keys:
+        board = BitBoard(own, opponent)
+        move_started = time.perf_counter_ns()
+        move = factory(board, stats=stats).move()
+        latencies.append((time.perf_counter_ns() - move_started) / 1e6)
+        if move_value(own, opponent, move) == table[(own, opponent)][0]:
+            optimal += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    probes = stats.cache_hits + stats.cache_misses
+    return {
+        "positions": len(keys),
+        "seconds": round(elapsed, 4),
+        "moves_per_sec": round(len(keys) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.5), 4),
+        "latency_p99_ms": round(percentile(latencies, 0.99), 4),
+        "latency_max_ms": round(latencies[-1], 4) if latencies else 0.0,
+        "nodes": stats.nodes,
+        "nodes_per_move": round(stats.nodes / max(stats.moves, 1), 2),
+        "cache_hit_ratio": round(stats.cache_hits / probes, 4) if probes else 0.0,
+        "max_depth": stats.max_depth,
+        "optimal_ratio": round(optimal / len(keys), 4) if keys else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Относительное изменение числовых метрик против базового прогона"""
+    lines = []
+    for engine, metrics in results["engines"].items():
+        old = baseline.get("engines", {}).get(engine)
+        if old is None:
+            continue
+        for key, value in metrics.items():
+            before = old.get(key)
+            if isinstance(value, (int, float)) and before:
+                change = (value - before) / before * 100
+                lines.append(f"{engine:16} {key:18} {before:>14} -> {value:>14} ({change:+.1f}%)")
+    return lines
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ai_engines")
+    parser.add_argument("--engines", nargs="+", default=DEFAULT_ENGINES, choices=sorted(ENGINES))
+    parser.add_argument("--limit", type=int, default=None, help="sample this many positions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    keys = positions(args.limit, args.seed)
+    results = {
+        "python": sys.version.split()[0],
+        "engines": {name: run_engine(name, keys) for name in args.engines},
+    }
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(results, baseline)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Время поиска пользователя и его счёта в базе на count пользователей
+до и после миграций из tictactoebot.migrations.
+
+База создаётся во временном файле на версии схемы --from-version,
+заполняется, затем меряются запросы Database, база мигрирует
+до последней версии, и запросы меряются снова.
+Database.get_user_with_score читает столбцы и таблицы последней схемы,
+поэтому до миграций вместо него меряется тот же JOIN по столбцам версии 1:
+
+    python -m benchmarks.db_lookup --count 1000000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from tictactoebot.db import Database, connect
+from tictactoebot.migrations import LATEST_VERSION, migrate
+
+
+BASE_USER_ID = 5_000_000_000
+BATCH = 100_000
+
+
+def fill(path: str, count: int, version: int):
+    conn = connect(path)
+    migrate(conn, version)
+    for start in range(0, count, BATCH):
+        ids = range(BASE_USER_ID + start, BASE_USER_ID + min(count, start + BATCH))
+        conn.executemany(
+            "INSERT INTO User (chat_id, language, difficulty) VALUES (?, 'en', 'easy')",
+            ((chat_id,) for chat_id in ids),
+        )
+        conn.executemany(
+            "INSERT INTO Score (user_id, player, bot, enemy, draw) VALUES (?, 0, 0, 0, 0)",
+            ((chat_id,) for chat_id in ids),
+        )
+        conn.commit()
+    conn.close()
+
+
+def join_initial_schema(db: Database, chat_id: int) -> Optional[tuple]:
+    """Запрос get_user_with_score без столбцов, добавленных после версии 1"""
+    db.cursor.execute(
+        """
+        SELECT
+            User.id, User.chat_id, User.language, User.difficulty, User.scores,
+            Score.id, Score.user_id, Score.player, Score.bot, Score.enemy, Score.draw
+        FROM User
+        LEFT JOIN Score ON Score.user_id = User.chat_id
+        WHERE User.chat_id = ?
+        """,
+        (chat_id,),
+    )
+    return db.cursor.fetchone()
+
+
+def measure(db: Database, ids: list[int], latest: bool) -> dict:
+    if latest:
+        get_user_with_score = db.get_user_with_score
+    else:
+        get_user_with_score = lambda chat_id: join_initial_schema(db, chat_id)
+    results = {}
+    for name, query in (
+        ("get_user_by_chat_id", lambda chat_id: db.get_user_by_chat_id(chat_id)),
+        ("get_user_score_by_user_id", lambda chat_id: db.get_user_score_by_user_id(chat_id)),
+        ("get_user_with_score", get_user_with_score),
+        ("update_user_score", lambda chat_id: db.update_user_score(chat_id, 1, 0, 0, 0)),
+    ):
+        latencies = []
+        for chat_id in ids:
+            started = time.perf_counter()
+            query(chat_id)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results[name] = {
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+            "p99_ms": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000, 4),
+        }
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.db_lookup")
+    parser.add_argument("--count", type=int, default=1_000_000, help="users in the database")
+    parser.add_argument("--lookups", type=int, default=200, help="random users to look up")
+    parser.add_argument("--from-version", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    # Database пишет в лог каждый запрос
+    logging.disable(logging.INFO)
+
+    directory = tempfile.mkdtemp(prefix="tictactoebot-db-")
+    path = os.path.join(directory, "gamedata.db")
+    started = time.perf_counter()
+    fill(path, args.count, args.from_version)
+    fill_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    ids = [BASE_USER_ID + rng.randrange(args.count) for _ in range(args.lookups)]
+
+    # Без миграций при открытии: схема остаётся той, что в файле
+    db = Database(path, migrate=False)
+    before = measure(db, ids, args.from_version == LATEST_VERSION)
+    started = time.perf_counter()
+    migrate(db.conn)
+    migrate_seconds = time.perf_counter() - started
+    after = measure(db, ids, True)
+    db.conn.close()
+    shutil.rmtree(directory)
+
+    report = {
+        "users": args.count,
+        "lookups": args.lookups,
+        "fill_seconds": round(fill_seconds, 2),
+        "migrate_seconds": round(migrate_seconds, 2),
+        f"version_{args.from_version}": before,
+        f"version_{LATEST_VERSION}": after,
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
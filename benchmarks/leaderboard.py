@@ -0,0 +1,87 @@
+"""
+Рейтинг (tictactoebot.leaderboard) против сортировки всех игроков.
+
+Случайные load/add/set с числом побед, которое переходит границы роста
+дерева (64, 128, ...). После каждой операции места из rank и top
+сравниваются с местами из полной сортировки. При расхождении скрипт
+завершается с кодом 1:
+
+    python -m benchmarks.leaderboard --ops 20000 --players 200
+"""
+import argparse
+import json
+import random
+import sys
+from bisect import bisect_right
+from typing import Optional
+
+from tictactoebot.leaderboard import Leaderboard
+
+
+def check(board: Leaderboard, wins: dict[int, int], players: int) -> list[str]:
+    """Расхождения рейтинга с полной сортировкой"""
+    values = sorted(wins.values())
+
+    def expected_place(user_id: int) -> int:
+        return len(values) - bisect_right(values, wins.get(user_id, 0)) + 1
+
+    errors = []
+    for user_id in range(players):
+        place, got = board.rank(user_id)
+        expected = (expected_place(user_id), wins.get(user_id, 0))
+        if (place, got) != expected:
+            errors.append(f"rank({user_id}) = {(place, got)}, expected {expected}")
+    ordered = [value for value in reversed(values) if value > 0]
+    top = board.top(10)
+    if [entry[2] for entry in top] != ordered[:10]:
+        errors.append(f"top wins {[entry[2] for entry in top]}, expected {ordered[:10]}")
+    for place, user_id, value in top:
+        if place != expected_place(user_id) or value != wins.get(user_id, 0):
+            errors.append(f"top entry {(place, user_id, value)} is wrong")
+    return errors
+
+
+def run(ops: int, players: int, max_wins: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    board = Leaderboard(refresh_seconds=0)
+    wins: dict[int, int] = {}
+    for op in range(ops):
+        user_id = rng.randrange(players)
+        kind = rng.random()
+        if kind < 0.01:
+            wins = {user_id: rng.randrange(max_wins) for user_id in range(players)}
+            board.load(list(wins.items()))
+        elif kind < 0.8:
+            # Рост по одной победе проходит каждую границу дерева
+            delta = rng.choice((1, 1, 1, 5, 40))
+            board.add(user_id, delta)
+            wins[user_id] = wins.get(user_id, 0) + delta
+        else:
+            value = rng.choice((0, rng.randrange(max_wins), rng.randrange(max_wins * 4)))
+            board.set(user_id, value)
+            wins[user_id] = value
+        errors = check(board, wins, players)
+        if errors:
+            return {"ops": op + 1, "errors": errors[:10]}
+    return {"ops": ops, "errors": [], **board.stats()}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.leaderboard")
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--max-wins", type=int, default=100,
+                        help="wins in load and set; add grows past it")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = run(args.ops, args.players, args.max_wins, args.seed)
+    print(json.dumps(report, indent=2))
+    if report["errors"]:
+        print("leaderboard differs from a full sort", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Память на одну активную партию и одного пользователя в кэше.
+
+Кладёт count объектов Board в BoardStore и UserData в UserCache
+так же, как это делает GameData, и измеряет прирост памяти через
+tracemalloc - вместе с расходами самих контейнеров (LRU, отметки времени).
+Изменённые поля забираются из BoardStore, как это делает Snapshotter,
+поэтому измеряется установившееся состояние. Завершается с кодом 1,
+если превышен бюджет на объект:
+
+    python -m benchmarks.memory --count 100000 --board-budget 500 --user-budget 460
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Callable, Optional
+
+from tictactoebot.board_store import BoardStore
+from tictactoebot.data import Board, UserData
+from tictactoebot.enums import Difficulty, Language, Symbol
+from tictactoebot.user_cache import UserCache
+
+
+# Типичные идентификаторы чатов Telegram не помещаются в 32 бита
+BASE_USER_ID = 5_000_000_000
+
+
+def measure(count: int, fill: Callable[[int], object]) -> float:
+    """Прирост памяти в байтах на один объект в контейнере, который строит fill"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = fill(count)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return (after - before) / count
+
+
+def make_board(i: int) -> Board:
+    board = Board.create(
+        BASE_USER_ID + i, BASE_USER_ID + i, 0,
+        f"Player {i}", "Bot", Symbol.CROSS, Symbol.ZERO,
+    )
+    # Партия в середине игры
+    board.user_step(board.author_id, 5)
+    board.bot_step(Difficulty.EASY)
+    return board
+
+
+def make_user(i: int) -> UserData:
+    # Строки в том виде, в каком они приходят из базы
+    return UserData.from_tuple(
+        (i, BASE_USER_ID + i, "".join(Language.ENGLISH), "".join(Difficulty.EASY))
+    )
+
+
+def fill_boards(count: int) -> BoardStore:
+    boards = BoardStore(max_size=count)
+    for i in range(count):
+        board = make_board(i)
+        boards.add(board.board_id, board)
+    boards.drain_changes()
+    return boards
+
+
+def fill_users(count: int) -> UserCache:
+    users = UserCache(max_size=count)
+    for i in range(count):
+        users.put(BASE_USER_ID + i, make_user(i))
+    return users
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.memory")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--board-budget", type=int, default=500, help="bytes per board")
+    parser.add_argument("--user-budget", type=int, default=460, help="bytes per user")
+    args = parser.parse_args(argv)
+
+    board_bytes = measure(args.count, fill_boards)
+    user_bytes = measure(args.count, fill_users)
+    report = {
+        "count": args.count,
+        "bytes_per_board": round(board_bytes, 1),
+        "bytes_per_user": round(user_bytes, 1),
+        "mb_per_million_boards": round(board_bytes * 1_000_000 / 2 ** 20, 1),
+        "mb_per_million_users": round(user_bytes * 1_000_000 / 2 ** 20, 1),
+        "board_budget": args.board_budget,
+        "user_budget": args.user_budget,
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if board_bytes > args.board_budget:
+        print(f"Board uses {board_bytes:.0f} bytes, budget {args.board_budget}", file=sys.stderr)
+        failed = True
+    if user_bytes > args.user_budget:
+        print(f"UserData uses {user_bytes:.0f} bytes, budget {args.user_budget}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
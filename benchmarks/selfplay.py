@@ -0,0 +1,181 @@
+"""
+Самоигра движков ИИ без Телеграма.
+
+Партии идут по правилам Board из tictactoebot.data, первым ходит автор.
+Режимы:
+    - по умолчанию партии распределяются по всем ядрам (multiprocessing);
+    - --vectorized играет все партии разом на NumPy
+      (только RandomAI и MiniMaxAI).
+
+    python -m benchmarks.selfplay RandomAI MiniMaxAI --games 1000000 --vectorized
+    python -m benchmarks.selfplay MiniMaxAI MCTSAI:easy --games 10000 --swap
+
+Движки с идеальной игрой не должны проигрывать ни одной партии,
+иначе скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.ai_engines import ENGINES
+from tictactoebot.batch import random_moves, table_moves, winners
+from tictactoebot.data import Board
+from tictactoebot.enums import GameResult, Symbol
+
+
+AUTHOR_ID, TARGET_ID = 1, 2
+PERFECT_ENGINES = frozenset({"MiniMaxAI", "AlphaBetaAI", "NegamaxAI", "TablebaseAI"})
+VECTORIZED_ENGINES = {"RandomAI": random_moves, "MiniMaxAI": table_moves}
+
+# Результаты с точки зрения первого движка
+WIN, DRAW, LOSS = "win", "draw", "loss"
+
+
+def play_game(first: str, second: str, first_is_author: bool) -> str:
+    """Одна партия по правилам Board, результат для движка first"""
+    board = Board.create(0, AUTHOR_ID, TARGET_ID, first, second, Symbol.CROSS, Symbol.ZERO)
+    players = (
+        (AUTHOR_ID, Board.AUTHOR, ENGINES[first if first_is_author else second]),
+        (TARGET_ID, Board.TARGET, ENGINES[second if first_is_author else first]),
+    )
+    while True:
+        for user_id, player, engine in players:
+            cells = board.cells.copy()
+            cells.turn = player
+            board.user_step(user_id, engine(cells).move())
+            if board.result == GameResult.DRAW:
+                return DRAW
+            if board.is_over():
+                author_won = board.result == GameResult.AUTHOR
+                return WIN if author_won == first_is_author else LOSS
+
+
+def play_chunk(args: tuple[str, str, int, bool, int]) -> dict[str, int]:
+    first, second, games, swap, seed = args
+    random.seed(seed)
+    counts = {WIN: 0, DRAW: 0, LOSS: 0}
+    for game in range(games):
+        first_is_author = not swap or game % 2 == 0
+        counts[play_game(first, second, first_is_author)] += 1
+    return counts
+
+
+def play_parallel(first: str, second: str, games: int,
+                  swap: bool, workers: int, seed: int) -> dict[str, int]:
+    chunk = max(1, min(10_000, games // (workers * 4) or 1))
+    tasks = []
+    remaining = games
+    while remaining > 0:
+        size = min(chunk, remaining)
+        # Чётный размер пакета сохраняет чередование сторон при --swap
+        if swap and size % 2 and remaining > size:
+            size += 1
+        tasks.append((first, second, size, swap, seed + len(tasks)))
+        remaining -= size
+
+    counts = {WIN: 0, DRAW: 0, LOSS: 0}
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(play_chunk, tasks):
+            for key, value in result.items():
+                counts[key] += value
+    return counts
+
+
+def play_vectorized(first: str, second: str, games: int,
+                    swap: bool, seed: int, batch: int = 1_000_000) -> dict[str, int]:
+    """
+    Все партии пакета идут одновременно: на каждом полуходе
+    ходы всех незаконченных партий считаются одной матричной операцией
+    """
+    rng = np.random.default_rng(seed)
+    counts = {WIN: 0, DRAW: 0, LOSS: 0}
+    for start in range(0, games, batch):
+        size = min(batch, games - start)
+        first_is_author = np.ones(size, dtype=bool)
+        if swap:
+            first_is_author[(np.arange(size) + start) % 2 == 1] = False
+        masks = [np.zeros(size, dtype=np.uint16), np.zeros(size, dtype=np.uint16)]
+        result = np.zeros(size, dtype=np.int8)  # 1 - победил автор, 2 - второй, 3 - ничья
+        active = np.ones(size, dtype=bool)
+
+        for ply in range(9):
+            player = ply % 2
+            own, opponent = masks[player], masks[player ^ 1]
+            # Движок игрока: first у автора, если first_is_author, иначе second
+            uses_first = first_is_author if player == 0 else ~first_is_author
+            moves = np.zeros(size, dtype=np.int64)
+            for name, selector in ((first, uses_first), (second, ~uses_first)):
+                index = np.flatnonzero(selector & active)
+                if index.size == 0:
+                    continue
+                engine = VECTORIZED_ENGINES[name]
+                if engine is random_moves:
+                    moves[index] = random_moves(own[index], opponent[index], rng)
+                else:
+                    moves[index] = engine(own[index], opponent[index])
+            played = active & (moves > 0)
+            own[played] |= (1 << (moves[played] - 1)).astype(np.uint16)
+            won = played & winners(own)
+            result[won] = player + 1
+            active &= ~won
+        result[active] = 3
+
+        author_won, target_won = result == 1, result == 2
+        counts[WIN] += int(((author_won & first_is_author) | (target_won & ~first_is_author)).sum())
+        counts[LOSS] += int(((target_won & first_is_author) | (author_won & ~first_is_author)).sum())
+        counts[DRAW] += int((result == 3).sum())
+    return counts
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.selfplay")
+    parser.add_argument("first", choices=sorted(ENGINES))
+    parser.add_argument("second", choices=sorted(ENGINES))
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--swap", action="store_true", help="alternate who moves first")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.vectorized:
+        unsupported = {args.first, args.second} - VECTORIZED_ENGINES.keys()
+        if unsupported:
+            parser.error(f"no vectorized version of {', '.join(sorted(unsupported))}")
+        counts = play_vectorized(args.first, args.second, args.games, args.swap, args.seed)
+    else:
+        counts = play_parallel(
+            args.first, args.second, args.games, args.swap, args.workers, args.seed
+        )
+    elapsed = time.perf_counter() - started
+
+    games = sum(counts.values())
+    report = {
+        "first": args.first,
+        "second": args.second,
+        "games": games,
+        "mode": "vectorized" if args.vectorized else f"processes:{args.workers}",
+        "seconds": round(elapsed, 3),
+        "games_per_sec": round(games / elapsed, 1),
+        **{f"{key}_rate": round(value / games, 4) for key, value in counts.items()},
+        **counts,
+    }
+    print(json.dumps(report, indent=2))
+
+    if (args.first in PERFECT_ENGINES and counts[LOSS]) or \
+            (args.second in PERFECT_ENGINES and counts[WIN]):
+        print("A perfect engine lost a game", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
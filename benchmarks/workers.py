@@ -0,0 +1,411 @@
+"""
+Несколько процессов бота на одной машине без Телеграма.
+
+Главный процесс играет роль приёма обновлений (tictactoebot.workers):
+собирает настоящие обновления Телеграма и раздаёт их через worker_of,
+а воркеры обрабатывают их в run_worker теми же роутерами, что и бот.
+Вместо сети у воркеров сессия Bot API, которая пересылает вызовы
+главному процессу. Процессы работают с общими файлами базы
+во временном каталоге.
+
+Сначала играются партии против бота: /start, выбор сложности, выбор
+стороны и ходы в случайные свободные клетки. Нажатие, на которое воркер
+ответил, что поля нет, считается попавшим не туда (misrouted).
+Затем для пар игроков с разными воркерами проверяется сброс кэша:
+партия по приглашению ведётся воркером второго игрока, первый меняет язык
+у своего воркера, и текст победы должен прийти уже на новом языке (иначе stale).
+При misrouted или stale скрипт завершается с кодом 1:
+
+    python -m benchmarks.workers --workers 1 --games 20000
+    python -m benchmarks.workers --workers 4 --games 20000
+
+--storage memory убирает из замера стоимость хранилища пользователей
+(см. tictactoebot.storage). У каждого процесса тогда свои пользователи,
+поэтому проверка сброса кэша пропускается:
+    python -m benchmarks.workers --workers 4 --games 20000 --storage memory
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from queue import Empty
+from typing import Optional
+
+from aiogram import types
+from aiogram.client.session.base import BaseSession
+
+from tictactoebot.bitboard import cell_bit, is_win
+from tictactoebot.enums import Difficulty, Language, Symbol
+from tictactoebot.filters import (
+    DifficultyFilter, FieldFilter, InviteFilter, LanguageFilter, PickFilter,
+)
+from tictactoebot.translate import get_translate
+
+
+BASE_USER_ID = 5_000_000_000
+FAKE_TOKEN = "123456:BENCHMARK"
+# Сколько ждать ответа воркера, прежде чем считать бенчмарк зависшим
+REPLY_TIMEOUT = 60.0
+
+
+class ForwardSession(BaseSession):
+    """Сессия Bot API, которая отправляет вызовы в очередь вместо Телеграма"""
+
+    def __init__(self, outbox: multiprocessing.Queue):
+        super().__init__()
+        self.outbox = outbox
+
+    async def make_request(self, bot, method, timeout=None):
+        key = None
+        for name in ("inline_message_id", "chat_id", "callback_query_id"):
+            key = getattr(method, name, None)
+            if key is not None:
+                break
+        markup = getattr(method, "reply_markup", None)
+        buttons = []
+        if isinstance(markup, types.InlineKeyboardMarkup):
+            buttons = [button.callback_data
+                       for row in markup.inline_keyboard for button in row]
+        self.outbox.put((method.__api_method__, str(key),
+                         getattr(method, "text", None), buttons))
+        if method.__api_method__ == "getChat":
+            return types.Chat(id=method.chat_id, type="private",
+                              first_name=name_of(method.chat_id))
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30,
+                             chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def name_of(user_id: int) -> str:
+    return f"P{user_id}"
+
+
+def worker_main(index: int, directory: str, queue: multiprocessing.Queue,
+                invalidations: list[multiprocessing.Queue],
+                outbox: multiprocessing.Queue):
+    # Базы открываются по относительным путям при импорте tictactoebot.data
+    os.chdir(directory)
+    from tictactoebot import callback_queries
+    from tictactoebot.workers import run_worker
+
+    session = ForwardSession(outbox)
+    # Приглашения и inline-поля отвечают через бота модуля callback_queries
+    callback_queries.bot.session = session
+    asyncio.run(run_worker(index, queue, invalidations, session))
+
+
+class Front:
+    """Главный процесс: раздаёт обновления воркерам и читает их ответы"""
+
+    def __init__(self, queues: list[multiprocessing.Queue],
+                 outbox: multiprocessing.Queue):
+        from tictactoebot.workers import worker_of
+
+        self.worker_of = worker_of
+        self.queues = queues
+        self.outbox = outbox
+        self.update_id = 0
+
+    def send(self, update: types.Update):
+        queue = self.queues[self.worker_of(update, len(self.queues))]
+        queue.put(update.model_dump(mode="json", exclude_none=True))
+
+    def reply(self) -> tuple[str, str, Optional[str], list[str]]:
+        try:
+            return self.outbox.get(timeout=REPLY_TIMEOUT)
+        except Empty:
+            raise TimeoutError(f"no reply from workers in {REPLY_TIMEOUT}s") from None
+
+    def warm_up(self):
+        """Ждёт, пока каждый воркер запустится и ответит на /start"""
+        user_ids = {}
+        user_id = BASE_USER_ID * 4
+        while len(user_ids) < len(self.queues):
+            user_ids.setdefault(_shard(self, user_id), user_id)
+            user_id += 1
+        for user_id in user_ids.values():
+            self.command(user_id, "/start")
+        for _ in user_ids:
+            self.reply()
+
+    def _next_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def command(self, user_id: int, text: str):
+        self.send(types.Update(update_id=self._next_id(), message=types.Message(
+            message_id=self.update_id, date=datetime.now(),
+            chat=private_chat(user_id), from_user=user(user_id), text=text,
+        )))
+
+    def press(self, user_id: int, data: str, inline_message_id: Optional[str] = None):
+        """Нажатие кнопки в личном чате или, с inline_message_id, в inline-сообщении"""
+        message = None
+        if inline_message_id is None:
+            message = types.Message(message_id=1, date=datetime.now(),
+                                    chat=private_chat(user_id))
+        self.send(types.Update(update_id=self._next_id(), callback_query=types.CallbackQuery(
+            id=inline_message_id or str(user_id), from_user=user(user_id),
+            chat_instance="0", data=data, message=message,
+            inline_message_id=inline_message_id,
+        )))
+
+
+def user(user_id: int) -> types.User:
+    return types.User(id=user_id, is_bot=False, first_name=name_of(user_id),
+                      language_code=Language.ENGLISH)
+
+
+def private_chat(user_id: int) -> types.Chat:
+    return types.Chat(id=user_id, type="private", first_name=name_of(user_id))
+
+
+def board_cells(buttons: list[str]) -> list[FieldFilter]:
+    prefix = FieldFilter.__prefix__ + ":"
+    return [FieldFilter.unpack(data) for data in buttons if data and data.startswith(prefix)]
+
+
+def is_finished(cells: list[FieldFilter]) -> bool:
+    """Закончена ли партия на поле 3x3 с клавиатуры"""
+    masks = {Symbol.CROSS: 0, Symbol.ZERO: 0}
+    for cell in cells:
+        if cell.status in masks:
+            masks[cell.status] |= cell_bit(cell.index)
+    full = all(cell.status != Symbol.EMPTY for cell in cells)
+    return full or any(is_win(mask) for mask in masks.values())
+
+
+def play_bot_games(front: Front, games: int, concurrency: int,
+                   difficulty: str, expired: str) -> dict:
+    """Партии против бота; ответы воркеров ведут каждого игрока по шагам"""
+    rng = random.Random(0)
+    # chat_id -> шаг, на котором игрок ждёт ответа
+    states: dict[str, str] = {}
+    next_user = 0
+    finished = clicks = misrouted = rejected = 0
+    while finished < games:
+        while len(states) < concurrency and next_user < games:
+            user_id = BASE_USER_ID + next_user
+            front.command(user_id, "/start")
+            states[str(user_id)] = "start"
+            next_user += 1
+
+        method, key, text, buttons = front.reply()
+        state = states.get(key)
+        if state is None:
+            continue
+        user_id = int(key)
+        if method == "answerCallbackQuery":
+            # Партия продолжаться не может, игрок уходит
+            if text == expired:
+                misrouted += 1
+            else:
+                rejected += 1
+            del states[key]
+            finished += 1
+        elif state == "start" and method == "sendMessage":
+            front.press(user_id, DifficultyFilter(level=difficulty).pack())
+            states[key] = "difficulty"
+        elif state == "difficulty" and method == "editMessageText":
+            front.press(user_id, PickFilter(value=Symbol.CROSS).pack())
+            states[key] = "play"
+        elif state == "play" and method == "editMessageText":
+            cells = board_cells(buttons)
+            if is_finished(cells):
+                states[key] = "over"
+                continue
+            cell = rng.choice([cell for cell in cells if cell.status == Symbol.EMPTY])
+            front.press(user_id, cell.pack())
+            clicks += 1
+        elif state == "over" and method == "editMessageText" and not board_cells(buttons):
+            del states[key]
+            finished += 1
+    return {"clicks": clicks, "misrouted": misrouted, "rejected": rejected}
+
+
+def check_invalidation(front: Front, pairs: int, workers: int) -> dict:
+    """
+    Пары (автор, соперник) на разных воркерах. Партию ведёт воркер соперника
+    и держит автора в кэше; автор меняет язык у своего воркера, после чего
+    текст его победы должен прийти на новом языке
+    """
+    language = Language.RUSSIAN
+    win_text = get_translate(language)["win.player"]
+    authors = [BASE_USER_ID * 2 + i for i in range(pairs)]
+    targets = []
+    candidate = BASE_USER_ID * 3
+    for author in authors:
+        while workers > 1 and _shard(front, author) == _shard(front, candidate):
+            candidate += 1
+        targets.append(candidate)
+        candidate += 1
+
+    def wait(expected: set[str], method: str,
+             with_board: Optional[bool] = None) -> dict[str, tuple[str, list[str]]]:
+        """Ждёт вызова method для каждого ключа, возвращает тексты и кнопки"""
+        replies = {}
+        while len(replies) < len(expected):
+            got, key, text, buttons = front.reply()
+            if got == "answerCallbackQuery" and key in expected:
+                raise RuntimeError(f"{key}: {text}")
+            if got != method or key not in expected or key in replies:
+                continue
+            if with_board is not None and bool(board_cells(buttons)) != with_board:
+                continue
+            replies[key] = (text, buttons)
+        return replies
+
+    for user_id in authors + targets:
+        front.command(user_id, "/start")
+    wait({str(user_id) for user_id in authors + targets}, "sendMessage")
+    # Новые пользователи должны попасть в базу раньше, чем их прочитает чужой воркер
+    flush_delay()
+
+    games = {author: f"g{author}" for author in authors}
+    for author, target in zip(authors, targets):
+        front.press(target, InviteFilter(author=author).pack(), games[author])
+    boards = wait(set(games.values()), "editMessageText", with_board=True)
+    board_ids = {
+        author: board_cells(boards[game][1])[0].board_id for author, game in games.items()
+    }
+
+    def move(player_of, index: int, with_board: bool = True) -> dict:
+        for author, target in zip(authors, targets):
+            game = games[author]
+            front.press(player_of(author, target), FieldFilter(
+                index=index, status=Symbol.EMPTY, board_id=board_ids[author]
+            ).pack(), game)
+        return wait(set(games.values()), "editMessageText", with_board=with_board)
+
+    for player_of, index in ((_author, 1), (_target, 4), (_author, 2), (_target, 5)):
+        move(player_of, index)
+
+    for author in authors:
+        front.press(author, LanguageFilter(code=language).pack())
+    wait({str(author) for author in authors}, "editMessageText")
+    flush_delay()
+
+    replies = move(_author, 3, with_board=False)
+    stale = sum(
+        not replies[games[author]][0].startswith(win_text.format(name_of(author)))
+        for author in authors
+    )
+    return {"pairs": pairs, "stale": stale}
+
+
+def _author(author: int, target: int) -> int:
+    return author
+
+
+def _target(author: int, target: int) -> int:
+    return target
+
+
+def _shard(front: Front, user_id: int) -> int:
+    update = types.Update(update_id=0, message=types.Message(
+        message_id=0, date=datetime.now(), chat=private_chat(user_id),
+        from_user=user(user_id), text="/start",
+    ))
+    return front.worker_of(update, len(front.queues))
+
+
+def flush_delay():
+    from tictactoebot.config import WRITE_BEHIND_INTERVAL_MS
+
+    # Пачка записи и доставка сброса кэша соседям
+    time.sleep(WRITE_BEHIND_INTERVAL_MS / 1000 + 1.0)
+
+
+def run(workers: int, games: int, concurrency: int, difficulty: str,
+        storage: str = "sqlite", pairs: int = 20) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(workers)]
+    invalidations = [context.Queue() for _ in range(workers)]
+    outbox = context.Queue()
+    os.environ["BOT_WORKERS"] = str(workers)
+    os.environ["AI_POOL_KIND"] = "thread"
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ.setdefault("TTT_API_TOKEN", FAKE_TOKEN)
+    expired = get_translate(Language.ENGLISH)["game.expired"]
+
+    with tempfile.TemporaryDirectory(prefix="tictactoebot-workers-") as directory:
+        processes = []
+        for index, queue in enumerate(queues):
+            os.environ["WORKER_INDEX"] = str(index)
+            process = context.Process(
+                target=worker_main,
+                args=(index, directory, queue, invalidations, outbox),
+            )
+            process.start()
+            processes.append(process)
+
+        front = Front(queues, outbox)
+        try:
+            front.warm_up()
+            started = time.perf_counter()
+            report = play_bot_games(front, games, concurrency, difficulty, expired)
+            elapsed = time.perf_counter() - started
+            invalidation = None
+            if storage == "sqlite":
+                invalidation = check_invalidation(front, pairs, workers)
+        finally:
+            for queue in queues:
+                queue.put(None)
+            for process in processes:
+                process.join()
+
+    return {
+        "workers": workers,
+        "storage": storage,
+        "games": games,
+        **report,
+        "seconds": round(elapsed, 3),
+        "games_per_sec": round(games / elapsed, 1),
+        "invalidation": invalidation,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=256, help="games in flight")
+    parser.add_argument("--difficulty", default=Difficulty.HARD,
+                        choices=[level.value for level in Difficulty])
+    parser.add_argument("--storage", default="sqlite", choices=("sqlite", "memory", "localkv"))
+    parser.add_argument("--pairs", type=int, default=20,
+                        help="invite games used to check cache invalidation")
+    args = parser.parse_args(argv)
+
+    report = run(args.workers, args.games, args.concurrency, args.difficulty,
+                 args.storage, args.pairs)
+    print(json.dumps(report, indent=2))
+    failed = False
+    if report["misrouted"]:
+        print(f"{report['misrouted']} presses reached a worker without the board",
+              file=sys.stderr)
+        failed = True
+    if report["rejected"]:
+        print(f"{report['rejected']} presses were rejected", file=sys.stderr)
+        failed = True
+    if report["invalidation"] and report["invalidation"]["stale"]:
+        print(f"{report['invalidation']['stale']} games used a stale cached user",
+              file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,9 @@ import logging.config
 
 from aiogram import Bot, Dispatcher
 
-from tictactoebot.config import BOT_TOKEN, LOGGING_CONFIG
+from tictactoebot.ai_pool import AI_POOL
+from tictactoebot.config import BOT_TOKEN, BOT_WORKERS, LOGGING_CONFIG
+from tictactoebot.data import DATA_GAME
 from tictactoebot.inline_queries import router as InlineQueriesRouter
 from tictactoebot.callback_queries import router as CallbackQueriesRouter
 from tictactoebot.commands import router as CommandsRouter
@@ -19,8 +21,18 @@ async def main() -> None:
     dp.include_router(CallbackQueriesRouter)
     dp.include_router(CommandsRouter)
 
-    await dp.start_polling(bot, skip_updates=True)
+    tasks = await DATA_GAME.start()
+    tasks.append(asyncio.create_task(AI_POOL.run()))
+    try:
+        await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await DATA_GAME.close(tasks)
+        AI_POOL.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_WORKERS > 1:
+        from tictactoebot.workers import run
+        run(BOT_WORKERS)
+    else:
+        asyncio.run(main())
@@ -1,22 +1,80 @@
-from contextlib import contextmanager
+from collections import OrderedDict
+import logging
+import math
 import random
+import threading
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from .bitboard import (
+    BitBoard, CLASSIC, FULL_MASK,
+    cell_bit, is_win, iter_cells,
+)
+from .config import AI_MOVE_BUDGET_MS, TABLEBASE_PATH
+from .enums import Difficulty
+from .tablebase import Tablebase
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SearchStats:
+    """
+    Счётчики поиска, накапливаемые по всем ходам.
+    Движки считают узлы и обращения к кэшу в своих полях
+    и передают итог в stats один раз за ход
+    """
+    moves: int = 0
+    nodes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    max_depth: int = 0
+
+    def record(self, nodes: int = 0, cache_hits: int = 0,
+               cache_misses: int = 0, depth: int = 0):
+        self.moves += 1
+        self.nodes += nodes
+        self.cache_hits += cache_hits
+        self.cache_misses += cache_misses
+        if depth > self.max_depth:
+            self.max_depth = depth
 
 
 class AI(ABC):
-    def __init__(self, board: dict[int, int]):
+    def __init__(self, board: BitBoard, stats: Optional[SearchStats] = None):
+        """
+        Инициализирует игровое поле (BitBoard).
+        Ход делает игрок board.turn: его маска board.own,
+        маска оппонента board.opponent.
+        stats - необязательные счётчики для бенчмарков
         """
-        Инициализирует игровое поле вида
-        board (dict[int, int]): {
-            1:-1, 2: 1, 3: 0,
-            4: 0, 5: 0, 6: 0,
-            7: 0, 8: 0, 9:-1}
+        self.board: BitBoard = board
+        self.stats = stats
 
-        1 всегда обозначает текущего игрока,
-        0 пустую ячейку,
-        -1 ячейку занятую оппонентом
+    def report(self, nodes: int = 0, cache_hits: int = 0,
+               cache_misses: int = 0, depth: int = 0):
+        if self.stats is not None:
+            self.stats.record(nodes, cache_hits, cache_misses, depth)
+
+    @classmethod
+    def create(cls, board: BitBoard, difficulty: Difficulty,
+               game_id: Optional[int] = None) -> "AI":
+        """
+        Движок для хода бота в партии game_id на сложности difficulty.
+        Движки, которым сложность и партия не нужны, их не получают
         """
-        self.board: dict[int, int] = board
+        return cls(board)
+
+    @classmethod
+    def is_cheap(cls, board: BitBoard) -> bool:
+        """
+        Ход на этом поле считается за микросекунды (без поиска),
+        и пул ИИ делает его прямо в цикле событий
+        """
+        return False
 
     @abstractmethod
     def move(self) -> int:
@@ -31,61 +89,72 @@ class RandomAI(AI):
     свободной ячейки на игровом поле
     """
 
+    @classmethod
+    def is_cheap(cls, board: BitBoard) -> bool:
+        return True
+
     def _get_empty_indexes(self) -> list[int]:
-        return [i for i, v in self.board.items() if v == 0]
+        return self.board.free_cells()
 
     def move(self) -> int:
+        self.report(nodes=1)
         return random.choice(self._get_empty_indexes())
 
 
 class MiniMaxAI(AI):
-    WINNING_COMBINATIONS = {
-        (1, 2, 3), (4, 5, 6), (7, 8, 9),
-        (1, 4, 7), (2, 5, 8), (3, 6, 9),
-        (1, 5, 9), (3, 5, 7),
-    }
+    """
+    Идеальная игра на поле 3x3
+    """
+
+    @classmethod
+    def is_cheap(cls, board: BitBoard) -> bool:
+        # На поле 3x3 ход берётся из таблицы решённых позиций
+        return board.geometry is CLASSIC
 
     def move(self) -> int:
         """
-        Возвращает оптимальный следующий ход на основе алгоритма MiniMax.
+        Возвращает оптимальный следующий ход из таблицы решённых позиций.
+        Если позиции нет в таблице (недостижимая расстановка),
+        выполняет полный перебор MiniMax.
+
+        Возвращает:
+            int: Индекс оптимального следующего хода на игровой доске.
+        """
+        entry = get_move_table().get((self.board.own, self.board.opponent))
+        if entry is not None:
+            self.report(nodes=1, cache_hits=1)
+            return entry[1][0]
+        move = self.search_move()
+        self.report(nodes=self.nodes, cache_misses=1)
+        return move
+
+    def search_move(self) -> int:
+        """
+        Возвращает оптимальный следующий ход на основе полного перебора MiniMax.
 
         Возвращает:
             int: Индекс оптимального следующего хода на игровой доске.
         """
         best_score = float("-inf")
         best_move = None
+        own, opponent = self.board.own, self.board.opponent
+        self.nodes = 0
 
-        for i in self.board.keys():
-            if self.board[i] == 0:
-                with self.set_board(i, 1):
-                    score = self.minimax(self.board, 0, False)
-                if score > best_score:
-                    best_score = score
-                    best_move = i
+        for i in iter_cells(self.board.empty):
+            score = self.minimax(own | cell_bit(i), opponent, 0, False)
+            if score > best_score:
+                best_score = score
+                best_move = i
 
         return best_move
 
-    @contextmanager
-    def set_board(self, index: int, value: int):
-        """
-        Временно изменяет игровое поле, устанавливая значение по указанному индексу.
-        Исходное значение сохраняется и восстанавливается после оператора yield.
-        """
-        original_value = self.board[index]
-        self.board[index] = value
-        try:
-            yield
-        finally:
-            self.board[index] = original_value
-
-
-    def minimax(self, board: dict[int, int], depth: int, is_maximizing: bool):
+    def minimax(self, own: int, opponent: int, depth: int, is_maximizing: bool):
         """
         Метод minimax реализует алгоритм MiniMax для определения оптимального следующего хода на игровой доске.
         
         Параметры:
-            board (dict[int, int]): Текущее состояние игровой доски в виде словаря, где ключи - индексы ячеек, 
-                                    значения - символы, обозначающие состояние ячейки (-1, 0, 1).
+            own (int): Маска ячеек, занятых игроком, для которого ищется ход.
+            opponent (int): Маска ячеек, занятых оппонентом.
             depth (int): Текущая глубина рекурсии.
             is_maximizing (bool): Флаг, указывающий, является ли текущий ход максимизирующим или минимизирующим.
             
@@ -100,74 +169,651 @@ class MiniMaxAI(AI):
             3. Если текущий ход максимизирующий:
             - Инициализируем переменную best_score с отрицательной бесконечностью.
             - Для каждой свободной ячейки на доске:
-                - Устанавливаем значение ячейки равным 1 (символ текущего игрока).
+                - Добавляем ячейку в маску own.
                 - Вызываем рекурсивно метод minimax для следующего хода с флагом is_maximizing=False.
-                - Восстанавливаем значение ячейки.
                 - Если полученный счет больше, чем best_score, обновляем best_score.
             - Возвращаем best_score.
             4. Если текущий ход минимизирующий:
             - Инициализируем переменную best_score с положительной бесконечностью.
             - Для каждой свободной ячейки на доске:
-                - Устанавливаем значение ячейки равным -1 (символ оппонента).
+                - Добавляем ячейку в маску opponent.
                 - Вызываем рекурсивно метод minimax для следующего хода с флагом is_maximizing=True.
-                - Восстанавливаем значение ячейки.
                 - Если полученный счет меньше, чем best_score, обновляем best_score.
             - Возвращаем best_score.
         """
-        if self.check_is_win(1):
+        self.nodes += 1
+        if is_win(own):
             return 1
-        elif self.check_is_win(-1):
+        elif is_win(opponent):
             return -1
-        elif self.check_draw():
+        elif own | opponent == FULL_MASK:
             return 0
 
+        empty = FULL_MASK & ~(own | opponent)
         if is_maximizing:
             best_score = float("-inf")
-            for i in board.keys():
-                if board[i] == 0:
-                    board[i] = 1
-                    score = self.minimax(board, depth + 1, False)
-                    board[i] = 0
-                    if score > best_score:
-                        best_score = score
+            for i in iter_cells(empty):
+                score = self.minimax(own | cell_bit(i), opponent, depth + 1, False)
+                if score > best_score:
+                    best_score = score
             return best_score
         else:
             best_score = float("inf")
-            for i in board.keys():
-                if board[i] == 0:
-                    board[i] = -1
-                    score = self.minimax(board, depth + 1, True)
-                    board[i] = 0
-                    if score < best_score:
-                        best_score = score
+            for i in iter_cells(empty):
+                score = self.minimax(own, opponent | cell_bit(i), depth + 1, True)
+                if score < best_score:
+                    best_score = score
             return best_score
 
-    def check_is_win(self, symbol: int):
+
+# Позиция (маска ходящего игрока, маска оппонента) -> (оценка, лучшие ходы)
+MoveTable = dict[tuple[int, int], tuple[int, tuple[int, ...]]]
+
+_move_table: Optional[MoveTable] = None
+
+
+def _solve(own: int, opponent: int, table: MoveTable) -> int:
+    """
+    Рекурсивно решает позицию с точки зрения ходящего игрока
+    и заносит в таблицу все нетерминальные позиции.
+    В дочерней позиции маски меняются местами, поэтому
+    первой в ключе всегда идёт маска ходящего игрока.
+    """
+    if is_win(opponent):
+        return -1
+    if own | opponent == FULL_MASK:
+        return 0
+    entry = table.get((own, opponent))
+    if entry is not None:
+        return entry[0]
+
+    scores = {
+        i: -_solve(opponent, own | cell_bit(i), table)
+        for i in iter_cells(FULL_MASK & ~(own | opponent))
+    }
+    best_score = max(scores.values())
+    best_moves = tuple(i for i, score in scores.items() if score == best_score)
+    table[(own, opponent)] = (best_score, best_moves)
+    return best_score
+
+
+def build_move_table() -> MoveTable:
+    """
+    Строит таблицу всех достижимых из пустого поля позиций 3x3
+    с их оценкой и лучшими ходами (в порядке возрастания индекса)
+    """
+    table: MoveTable = {}
+    _solve(0, 0, table)
+    return table
+
+
+def get_move_table() -> MoveTable:
+    """
+    Возвращает таблицу решённых позиций, строит её при первом обращении
+    """
+    global _move_table
+    if _move_table is None:
+        _move_table = build_move_table()
+    return _move_table
+
+
+def verify_move_table() -> int:
+    """
+    Сверяет таблицу с полным перебором MiniMaxAI для каждой позиции.
+    Возвращает количество проверенных позиций.
+    """
+    table = get_move_table()
+    for (own, opponent), (_, best_moves) in table.items():
+        board = BitBoard(own, opponent)
+        move = MiniMaxAI(board).search_move()
+        assert move == best_moves[0], (own, opponent, move, best_moves)
+        assert AlphaBetaAI(board).move() == move, (own, opponent, move)
+    return len(table)
+
+
+def _make_symmetries() -> tuple[tuple[int, ...], ...]:
+    """
+    Для каждой из 8 симметрий поля 3x3 (повороты и отражения)
+    строит таблицу перестановки битов: symmetry[mask] -> mask
+    """
+    transforms = (
+        lambda r, c: (r, c),
+        lambda r, c: (c, 2 - r),
+        lambda r, c: (2 - r, 2 - c),
+        lambda r, c: (2 - c, r),
+        lambda r, c: (r, 2 - c),
+        lambda r, c: (2 - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (2 - c, 2 - r),
+    )
+    symmetries = []
+    for t in transforms:
+        targets = [3 * t(*divmod(i, 3))[0] + t(*divmod(i, 3))[1] for i in range(9)]
+        symmetries.append(tuple(
+            sum(1 << targets[i] for i in range(9) if mask >> i & 1)
+            for mask in range(FULL_MASK + 1)
+        ))
+    return tuple(symmetries)
+
+
+SYMMETRIES = _make_symmetries()
+
+
+def canonical(own: int, opponent: int) -> int:
+    """Канонический (минимальный) ключ позиции среди 8 симметрий"""
+    return min(symmetry[own] << 9 | symmetry[opponent] for symmetry in SYMMETRIES)
+
+
+class TranspositionTable:
+    """
+    Ограниченная по размеру таблица транспозиций.
+    При переполнении вытесняется давно не использованная запись (LRU).
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.entries: OrderedDict[int, tuple[int, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: int) -> Optional[tuple[int, int]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: int, value: int, flag: int):
+        self.entries[key] = (value, flag)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+class AlphaBetaAI(AI):
+    """
+    Перебор с альфа-бета отсечением и таблицей транспозиций,
+    ключом которой служит каноническая форма позиции с учётом симметрий.
+    Выбирает тот же ход, что и MiniMaxAI (первый из лучших по индексу).
+    Работает только на поле 3x3.
+    """
+    table = TranspositionTable()
+
+    def __init__(self, board: BitBoard, stats: Optional[SearchStats] = None):
+        super().__init__(board, stats)
+        self.nodes = 0
+
+    def move(self) -> int:
+        hits, misses = self.table.hits, self.table.misses
+        own, opponent = self.board.own, self.board.opponent
+        best_score = -2
+        best_move = None
+        for i in iter_cells(self.board.empty):
+            # Ходы, не лучшие уже найденного, дают отсечение по alpha
+            # и не могут вытеснить первый лучший ход
+            score = -self.negamax(opponent, own | cell_bit(i), -2, -best_score)
+            if score > best_score:
+                best_score = score
+                best_move = i
+            if best_score == 1:
+                break
+        self.report(
+            self.nodes, self.table.hits - hits, self.table.misses - misses,
+            self.board.empty.bit_count(),
+        )
+        return best_move
+
+    def negamax(self, own: int, opponent: int, alpha: int, beta: int) -> int:
+        """
+        Возвращает оценку позиции для ходящего игрока (маска own)
+        в окне (alpha, beta)
         """
-        Проверяет, выиграл ли указанный символ в игре.
+        self.nodes += 1
+        if is_win(opponent):
+            return -1
+        if own | opponent == FULL_MASK:
+            return 0
 
-        Параметры:
-            symbol (int): Символ, который нужно проверить на выигрыш (-1 или 1).
+        alpha_original = alpha
+        key = canonical(own, opponent)
+        entry = self.table.get(key)
+        if entry is not None:
+            value, flag = entry
+            if flag == TranspositionTable.EXACT:
+                return value
+            if flag == TranspositionTable.LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
 
-        Возвращает:
-            bool: True, если символ выиграл игру, False - в противном случае.
+        best_score = -2
+        for i in iter_cells(FULL_MASK & ~(own | opponent)):
+            score = -self.negamax(opponent, own | cell_bit(i), -beta, -alpha)
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_original:
+            flag = TranspositionTable.UPPER
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        self.table.put(key, best_score, flag)
+        return best_score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class NegamaxAI(AI):
+    """
+    Поиск для поля любого размера (Geometry) с k в ряд:
+    negamax с альфа-бета отсечением, итеративным углублением,
+    упорядочиванием ходов (ход из таблицы транспозиций, эвристика истории,
+    число линий через ячейку) и ограничением времени на ход.
+    Если полный перебор не успевает закончиться, возвращается
+    лучший ход последней завершённой глубины.
+    """
+    WIN_SCORE = 1_000_000
+    # Вес открытой линии в зависимости от числа своих символов в ней
+    LINE_WEIGHTS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+    TABLE_LIMIT = 1_000_000
+    # Часы проверяются раз в CHECK_EVERY узлов на поле 3x3; на больших полях
+    # узел дороже (оценка по всем линиям, сортировка ходов), и интервал
+    # уменьшается пропорционально числу линий и ячеек
+    CHECK_EVERY = 256
+    CHECK_COST = 17
+
+    def __init__(self, board: BitBoard, budget_ms: Optional[int] = None,
+                 stats: Optional[SearchStats] = None):
+        super().__init__(board, stats)
+        self.geometry = board.geometry
+        self.budget_ms = AI_MOVE_BUDGET_MS if budget_ms is None else budget_ms
+        self.deadline = 0.0
+        self.nodes = 0
+        self.depth = 0
+        self.table: dict[tuple[int, int], tuple[int, int, int, int]] = {}
+        self.history = [0] * (len(self.geometry.cells) + 1)
+        node_cost = len(self.geometry.line_masks) + len(self.geometry.cells)
+        self.check_every = max(1, self.CHECK_EVERY * self.CHECK_COST // node_cost)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def move(self) -> int:
+        move = self.search()
+        self.report(self.nodes, self.cache_hits, self.cache_misses, self.depth)
+        return move
+
+    def search(self) -> int:
+        self.deadline = time.perf_counter() + self.budget_ms / 1000
+        own, opponent = self.board.own, self.board.opponent
+        empty = self.board.empty
+        moves = self.order_moves(empty, 0)
+        best_move = moves[0]
+
+        for i in moves:
+            if self.geometry.is_win_at(own | cell_bit(i), i):
+                return i
+
+        for depth in range(1, empty.bit_count() + 1):
+            try:
+                score, move = self.search_root(own, opponent, depth, best_move)
+            except SearchTimeout:
+                break
+            best_move = move
+            self.depth = depth
+            if abs(score) >= self.WIN_SCORE - self.geometry.full_mask.bit_length():
+                break
+        return best_move
+
+    def search_root(self, own: int, opponent: int,
+                    depth: int, first_move: int) -> tuple[int, int]:
+        alpha, beta = -self.WIN_SCORE - 1, self.WIN_SCORE + 1
+        best_move = first_move
+        for i in self.order_moves(self.board.empty, first_move):
+            if time.perf_counter() > self.deadline:
+                raise SearchTimeout
+            score = -self.negamax(opponent, own | cell_bit(i), i, depth - 1, -beta, -alpha)
+            if score > alpha:
+                alpha = score
+                best_move = i
+        return alpha, best_move
+
+    def negamax(self, own: int, opponent: int, last: int,
+                depth: int, alpha: int, beta: int) -> int:
         """
-        for combination in self.WINNING_COMBINATIONS:
-            if all(self.board[i] == symbol for i in combination):
-                return True
-        return False
+        Оценка позиции для ходящего игрока (маска own)
+        после хода оппонента в ячейку last
+        """
+        self.nodes += 1
+        if self.nodes % self.check_every == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        stones = (own | opponent).bit_count()
+        if self.geometry.is_win_at(opponent, last):
+            # Чем раньше победа, тем выше оценка
+            return stones - self.WIN_SCORE
+        empty = self.geometry.full_mask & ~(own | opponent)
+        if not empty:
+            return 0
+        if depth == 0:
+            return self.evaluate(own, opponent)
+
+        key = (own, opponent)
+        table_move = 0
+        entry = self.table.get(key)
+        if entry is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+            entry_depth, value, flag, table_move = entry
+            if entry_depth >= depth:
+                if flag == TranspositionTable.EXACT:
+                    return value
+                if flag == TranspositionTable.LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        alpha_original = alpha
+        best_score = -self.WIN_SCORE - 1
+        best_move = 0
+        for i in self.order_moves(empty, table_move):
+            score = -self.negamax(opponent, own | cell_bit(i), i, depth - 1, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+                best_move = i
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.history[i] += depth * depth
+                break
+
+        if best_score <= alpha_original:
+            flag = TranspositionTable.UPPER
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        if len(self.table) >= self.TABLE_LIMIT:
+            self.table.clear()
+        self.table[key] = (depth, best_score, flag, best_move)
+        return best_score
+
+    def order_moves(self, empty: int, first_move: int) -> list[int]:
+        weights = self.geometry.cell_weights
+        history = self.history
+        moves = sorted(
+            iter_cells(empty),
+            key=lambda i: (i != first_move, -history[i], -weights[i]),
+        )
+        return moves
+
+    def evaluate(self, own: int, opponent: int) -> int:
+        """Эвристическая оценка: открытые линии игрока минус открытые линии оппонента"""
+        weights = self.LINE_WEIGHTS
+        last_weight = weights[-1]
+        score = 0
+        for line in self.geometry.line_masks:
+            own_part = own & line
+            opponent_part = opponent & line
+            if own_part and not opponent_part:
+                count = own_part.bit_count()
+                score += weights[count] if count < len(weights) else last_weight
+            elif opponent_part and not own_part:
+                count = opponent_part.bit_count()
+                score -= weights[count] if count < len(weights) else last_weight
+        return score
+
+
+class TablebaseAI(AI):
+    """
+    Идеальная игра по таблице эндшпилей, отображённой в память (mmap).
+    Таблица открывается один раз на процесс и делится между всеми
+    экземплярами, а страницы файла - между всеми процессами.
+    Если файла нет или он построен для другого поля,
+    ход выбирает NegamaxAI.
+    """
+    tablebases: dict[str, Optional[Tablebase]] = {}
+
+    def __init__(self, board: BitBoard, path: str = TABLEBASE_PATH,
+                 stats: Optional[SearchStats] = None):
+        super().__init__(board, stats)
+        self.path = path
 
-    def check_draw(self):
+    @classmethod
+    def get_tablebase(cls, path: str) -> Optional[Tablebase]:
+        if path not in cls.tablebases:
+            try:
+                cls.tablebases[path] = Tablebase.open(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Tablebase {path} is not available: {e}")
+                cls.tablebases[path] = None
+        return cls.tablebases[path]
+
+    def move(self) -> int:
+        tablebase = self.get_tablebase(self.path)
+        if tablebase is None or tablebase.geometry is not self.board.geometry:
+            return NegamaxAI(self.board, stats=self.stats).move()
+
+        # Первым ходит тот, чьих символов не меньше, чем у соперника
+        own, opponent = self.board.own, self.board.opponent
+        if own.bit_count() == opponent.bit_count():
+            first, second = own, opponent
+        else:
+            first, second = opponent, own
+        value, moves = tablebase.best_moves(first, second)
+        if not moves or value == 0:
+            return NegamaxAI(self.board, stats=self.stats).move()
+        self.report(nodes=self.board.empty.bit_count())
+        return moves[0]
+
+
+class MCTSNode:
+    """
+    Узел дерева MCTS. own - маска игрока, который ходит в этой позиции,
+    wins - сумма результатов игрока, сделавшего ход move в эту позицию
+    """
+    __slots__ = (
+        "own", "opponent", "move", "parent",
+        "children", "untried", "visits", "wins", "result",
+    )
+
+    def __init__(self, own: int, opponent: int, move: int = 0,
+                 parent: Optional["MCTSNode"] = None,
+                 untried: Optional[list[int]] = None,
+                 result: Optional[float] = None):
+        self.own = own
+        self.opponent = opponent
+        self.move = move
+        self.parent = parent
+        self.children: list[MCTSNode] = []
+        self.untried = untried or []
+        self.visits = 0
+        self.wins = 0.0
+        # Результат для сделавшего ход, если позиция конечная
+        self.result = result
+
+
+class MCTSAI(AI):
+    """
+    Поиск по дереву Монте-Карло (UCT) для поля любого размера.
+    Ход выбирается за фиксированное число симуляций или время
+    (что закончится раньше), бюджет зависит от сложности.
+    Если задан game_id, поддерево выбранного хода сохраняется
+    в процессе и продолжается на следующем ходу той же партии
+    (пул ИИ считает ходы одной партии в одном процессе).
+    """
+    EXPLORATION = math.sqrt(2)
+    # Сложность -> (число симуляций, время в миллисекундах)
+    BUDGETS = {
+        Difficulty.EASY: (100, 50),
+        Difficulty.MEDIUM: (1_000, 200),
+        Difficulty.HARD: (20_000, AI_MOVE_BUDGET_MS),
+    }
+    MAX_TREES = 10_000
+    # game_id -> узел после последнего хода бота в этой партии
+    trees: OrderedDict[int, MCTSNode] = OrderedDict()
+    trees_lock = threading.Lock()
+
+    def __init__(self, board: BitBoard, difficulty: Difficulty = Difficulty.MEDIUM,
+                 stats: Optional[SearchStats] = None, game_id: Optional[int] = None):
+        super().__init__(board, stats)
+        self.geometry = board.geometry
+        self.playouts, self.budget_ms = self.BUDGETS[difficulty]
+        self.game_id = game_id
+        self.iterations = 0
+
+    @classmethod
+    def create(cls, board: BitBoard, difficulty: Difficulty,
+               game_id: Optional[int] = None) -> "MCTSAI":
+        return cls(board, difficulty, game_id=game_id)
+
+    def move(self) -> int:
+        own, opponent = self.board.own, self.board.opponent
+        empty = self.board.empty
+        for i in iter_cells(empty):
+            if self.geometry.is_win_at(own | cell_bit(i), i):
+                self.report(nodes=1)
+                return i
+
+        root = self.saved_root(own, opponent)
+        reused = root is not None
+        if root is None:
+            root = MCTSNode(own, opponent, untried=self.shuffled(empty))
+
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        while self.iterations < self.playouts:
+            self.iterate(root)
+            self.iterations += 1
+            if self.iterations % 64 == 0 and time.perf_counter() > deadline:
+                break
+
+        best = max(root.children, key=lambda child: child.visits)
+        self.save_root(best)
+        self.report(self.iterations, int(reused), int(not reused))
+        return best.move
+
+    def saved_root(self, own: int, opponent: int) -> Optional[MCTSNode]:
+        """
+        Узел текущей позиции из дерева прошлого хода партии:
+        ответ соперника на сохранённый ход бота
         """
-        Проверяет, является ли игра ничьей.
+        if self.game_id is None:
+            return None
+        with self.trees_lock:
+            node = self.trees.pop(self.game_id, None)
+        if node is None:
+            return None
+        for child in node.children:
+            if child.own == own and child.opponent == opponent:
+                child.parent = None
+                return child
+        return None
 
-        Возвращает:
-            bool: True, если игра закончилась ничьей, False - в противном случае.
+    def save_root(self, node: MCTSNode):
+        if self.game_id is None or node.result is not None:
+            return
+        node.parent = None
+        with self.trees_lock:
+            self.trees[self.game_id] = node
+            while len(self.trees) > self.MAX_TREES:
+                self.trees.popitem(last=False)
+
+    def shuffled(self, empty: int) -> list[int]:
+        moves = list(iter_cells(empty))
+        random.shuffle(moves)
+        return moves
+
+    def iterate(self, root: MCTSNode):
+        node = root
+        # Выбор
+        while not node.untried and node.children:
+            node = self.select(node)
+        # Расширение
+        if node.result is None and node.untried:
+            node = self.expand(node)
+        # Симуляция
+        if node.result is not None:
+            reward = node.result
+        else:
+            reward = self.playout(node.own, node.opponent)
+        # Обратное распространение
+        while node is not None:
+            node.visits += 1
+            node.wins += reward
+            reward = 1 - reward
+            node = node.parent
+
+    def select(self, node: MCTSNode) -> MCTSNode:
+        log_visits = math.log(node.visits)
+        exploration = self.EXPLORATION
+        return max(
+            node.children,
+            key=lambda child: child.wins / child.visits
+            + exploration * math.sqrt(log_visits / child.visits),
+        )
+
+    def expand(self, node: MCTSNode) -> MCTSNode:
+        i = node.untried.pop()
+        mover = node.own | cell_bit(i)
+        empty = self.geometry.full_mask & ~(mover | node.opponent)
+        if self.geometry.is_win_at(mover, i):
+            result: Optional[float] = 1.0
+        elif not empty:
+            result = 0.5
+        else:
+            result = None
+        child = MCTSNode(
+            node.opponent, mover, i, node,
+            self.shuffled(empty) if result is None else None, result,
+        )
+        node.children.append(child)
+        return child
+
+    def playout(self, own: int, opponent: int) -> float:
         """
-        for v in self.board.values():
-            if v == 0:
-                return False
-        return True
+        Случайная партия из позиции, где ходит own.
+        Возвращает результат для игрока opponent (сделавшего последний ход)
+        """
+        moves = list(iter_cells(self.geometry.full_mask & ~(own | opponent)))
+        random.shuffle(moves)
+        masks = [own, opponent]
+        turn = 0
+        for i in moves:
+            masks[turn] |= cell_bit(i)
+            if self.geometry.is_win_at(masks[turn], i):
+                return 0.0 if turn == 0 else 1.0
+            turn ^= 1
+        return 0.5
+
+
+AI_MAPPING: dict[str, type[AI]] = {
+    Difficulty.EASY: RandomAI,
+    Difficulty.MEDIUM: MCTSAI,
+    Difficulty.HARD: MiniMaxAI,
+}
 
 
 def test1():
@@ -176,8 +822,9 @@ def test1():
         4: 0,  5: 0, 6: 0, 
         7: 0,  8: 0, 9: -1
     }
-    move = MiniMaxAI(board).move()
+    move = MiniMaxAI(BitBoard.from_dict(board)).move()
     assert move == 5
+    assert AlphaBetaAI(BitBoard.from_dict(board)).move() == 5
 
 
 def test2():
@@ -186,10 +833,23 @@ def test2():
         4: -1, 5: 1, 6: 0, 
         7: 0,  8: 0, 9: -1
     }
-    move = MiniMaxAI(board).move()
+    move = MiniMaxAI(BitBoard.from_dict(board)).move()
     assert move == 7
+    assert AlphaBetaAI(BitBoard.from_dict(board)).move() == 7
+
+
+def test3():
+    board = {
+        1: -1, 2: 1, 3: 0,
+        4: -1, 5: 1, 6: 0,
+        7: 0,  8: 0, 9: -1
+    }
+    for move_budget in (50, 1000):
+        assert NegamaxAI(BitBoard.from_dict(board), move_budget).move() == 8
 
 
 if __name__ == "__main__":
     test1()
     test2()
+    test3()
+    print(f"Move table verified: {verify_move_table()} positions")
@@ -0,0 +1,251 @@
+"""
+Вычисление ходов ИИ в пуле процессов (или потоков),
+чтобы поиск хода не блокировал цикл событий aiogram.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from .ai import AI_MAPPING, RandomAI
+from .batch import MoveBatcher
+from .bitboard import BitBoard, get_geometry
+from .config import (
+    AI_POOL_KIND, AI_POOL_SIZE,
+    AI_POOL_MAX_PENDING, AI_MOVE_TIMEOUT_MS,
+    AI_BATCH_WINDOW_MS, AI_BATCH_MAX_SIZE, STATS_LOG_INTERVAL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def compute_move(first: int, second: int, turn: int,
+                 size: int, k: int, difficulty: str,
+                 game_id: Optional[int] = None) -> int:
+    """
+    Выполняется в процессе пула. Поле передаётся масками,
+    чтобы аргументы дёшево сериализовались
+    """
+    board = BitBoard(first, second, turn, get_geometry(size, k))
+    return AI_MAPPING[difficulty].create(board, difficulty, game_id).move()
+
+
+def warm_up() -> int:
+    """Пустая задача: процесс пула запускается и импортирует модули заранее"""
+    return os.getpid()
+
+
+class AIPool:
+    """
+    Пул для вычисления ходов ИИ.
+    Ход, который не уложился в таймаут, не попал в очередь
+    или завершился ошибкой, заменяется случайным ходом.
+    Если задано окно пакетной обработки, дешёвые ходы на поле 3x3
+    собираются в пакеты и считаются на NumPy прямо в цикле событий;
+    если пакет не успел или упал, ход считается тем же движком без пакета.
+    Дешёвые ходы (AI.is_cheap: случайный ход, таблица 3x3) считаются
+    в цикле событий без пула: передача хода в процесс стоит дороже самого хода.
+    Пул процессов - size процессов с отдельной очередью у каждого:
+    ходы одной партии всегда считаются в одном процессе,
+    чтобы MCTSAI продолжал дерево прошлого хода.
+    """
+    LATENCY_WINDOW = 10_000
+
+    def __init__(self, kind: str = AI_POOL_KIND, size: int = AI_POOL_SIZE,
+                 max_pending: int = AI_POOL_MAX_PENDING,
+                 timeout_ms: int = AI_MOVE_TIMEOUT_MS,
+                 batch_window_ms: int = AI_BATCH_WINDOW_MS,
+                 batch_max_size: int = AI_BATCH_MAX_SIZE):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown AI pool kind: {kind}")
+        self.kind = kind
+        self.size = size
+        self.max_pending = max_pending
+        self.timeout = timeout_ms / 1000
+        self.executors: list[Executor] = []
+        self.next_executor = 0
+        self.batcher: Optional[MoveBatcher] = None
+        if batch_window_ms > 0:
+            self.batcher = MoveBatcher(batch_window_ms, batch_max_size)
+
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.errors = 0
+        self.inline = 0
+        self.latencies: deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+
+    def get_executors(self) -> list[Executor]:
+        """Пул создаётся при первом ходе, а не при импорте модуля"""
+        if not self.executors:
+            if self.kind == "process":
+                # fork из процесса с потоками базы может унаследовать
+                # захваченные блокировки, поэтому процессы пула запускаются заново
+                context = multiprocessing.get_context("spawn")
+                self.executors = [
+                    ProcessPoolExecutor(1, mp_context=context) for _ in range(self.size)
+                ]
+            else:
+                # Потоки делят память процесса, деревья MCTS видны всем
+                self.executors = [ThreadPoolExecutor(self.size, thread_name_prefix="ai")]
+            logger.info(f"Started {self.kind} AI pool with {self.size} workers")
+        return self.executors
+
+    def get_executor(self, game_id: Optional[int] = None) -> Executor:
+        """Исполнитель партии game_id; ходы вне партии - по очереди"""
+        executors = self.get_executors()
+        if game_id is None:
+            game_id = self.next_executor
+            self.next_executor += 1
+        return executors[game_id % len(executors)]
+
+    async def bot_step(self, board, difficulty: str):
+        """
+        Асинхронный аналог Board.bot_step
+        """
+        if board.is_over():
+            return
+        move = await self.move(board.bot_cells(), difficulty, board.board_id)
+        board.apply_bot_move(move)
+
+    async def move(self, cells: BitBoard, difficulty: str,
+                   game_id: Optional[int] = None) -> int:
+        started = time.perf_counter()
+        if self.batcher is not None and self.batcher.supports(cells, difficulty):
+            try:
+                move = await asyncio.wait_for(self.batcher.move(cells, difficulty), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Batched AI move timed out after {self.timeout}s, computing it inline")
+                move = self.local_move(cells, difficulty)
+            except Exception:
+                self.errors += 1
+                logger.exception("Batched AI move failed, computing it inline")
+                move = self.local_move(cells, difficulty)
+            finally:
+                self.latencies.append(time.perf_counter() - started)
+            return move
+
+        if AI_MAPPING[difficulty].is_cheap(cells):
+            move = self.local_move(cells, difficulty)
+            self.inline += 1
+            self.latencies.append(time.perf_counter() - started)
+            return move
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return self.fallback_move(cells)
+
+        loop = asyncio.get_running_loop()
+        try:
+            job = self.get_executor(game_id).submit(
+                compute_move,
+                cells.first, cells.second, cells.turn,
+                cells.geometry.size, cells.geometry.k, difficulty, game_id,
+            )
+        except Exception:
+            self.errors += 1
+            logger.exception("AI move failed, using fallback")
+            return self.fallback_move(cells)
+        # Ход считается в очереди, пока пул его не закончит,
+        # даже если ожидание уже прервано таймаутом
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        job.add_done_callback(lambda _: self._job_done(loop))
+        try:
+            move = await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"AI move timed out after {self.timeout}s, using fallback")
+            move = self.fallback_move(cells)
+        except Exception:
+            self.errors += 1
+            logger.exception("AI move failed, using fallback")
+            move = self.fallback_move(cells)
+        else:
+            self.completed += 1
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+        return move
+
+    def _job_done(self, loop: asyncio.AbstractEventLoop):
+        """Вызывается из потока пула, счётчик меняется в цикле событий"""
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            # Цикл событий уже закрыт при остановке бота
+            pass
+
+    def _finished(self):
+        self.pending -= 1
+
+    def fallback_move(self, cells: BitBoard) -> int:
+        return RandomAI(cells).move()
+
+    def local_move(self, cells: BitBoard, difficulty: str) -> int:
+        """
+        Ход без пакета прямо в цикле событий: пакеты считаются
+        только для дешёвых движков (случайный ход, таблица 3x3)
+        """
+        try:
+            return AI_MAPPING[difficulty](cells).move()
+        except Exception:
+            logger.exception("AI move failed, using fallback")
+            return self.fallback_move(cells)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "kind": self.kind,
+            "workers": self.size,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "inline": self.inline,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p99_ms": percentile(0.99),
+            "batches": self.batcher.batches if self.batcher else 0,
+            "batched_moves": self.batcher.moves if self.batcher else 0,
+        }
+
+    async def run(self, interval: float = STATS_LOG_INTERVAL):
+        """
+        Запускает процессы пула, не дожидаясь первого хода: запуск
+        занимает секунды и не должен съедать таймаут хода.
+        Затем периодически пишет статистику пула в лог
+        """
+        if self.kind == "process":
+            for executor in self.get_executors():
+                executor.submit(warm_up)
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"AI pool stats: {self.stats()}")
+
+    def shutdown(self):
+        if self.executors:
+            logger.info(f"AI pool stats: {self.stats()}")
+            for executor in self.executors:
+                executor.shutdown(cancel_futures=True)
+            self.executors = []
+
+
+AI_POOL = AIPool()
@@ -0,0 +1,143 @@
+"""
+Пакетное вычисление ходов ИИ для многих партий 3x3 сразу на NumPy.
+
+Позиции кодируются парами масок (ходящий игрок, оппонент),
+проверка линий, выбор случайного свободного хода и поиск в таблице
+решённых позиций выполняются матричными операциями над всем пакетом.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .ai import AI_MAPPING, get_move_table
+from .bitboard import CLASSIC, FULL_MASK, LINE_MASKS, BitBoard
+from .enums import Difficulty
+
+
+LINES = np.array(LINE_MASKS, dtype=np.uint16)
+BITS = np.arange(9, dtype=np.uint16)
+
+# Сложности, для которых есть векторная реализация
+BATCH_DIFFICULTIES = frozenset({Difficulty.EASY, Difficulty.HARD})
+
+_best_moves: Optional[np.ndarray] = None
+
+
+def get_best_moves() -> np.ndarray:
+    """
+    Плоская таблица лучших ходов MiniMaxAI: индекс own << 9 | opponent,
+    0 для позиций, которых нет в таблице
+    """
+    global _best_moves
+    if _best_moves is None:
+        best_moves = np.zeros((FULL_MASK + 1) << 9, dtype=np.int8)
+        for (own, opponent), (_, moves) in get_move_table().items():
+            best_moves[own << 9 | opponent] = moves[0]
+        _best_moves = best_moves
+    return _best_moves
+
+
+def encode(boards: Sequence[BitBoard]) -> tuple[np.ndarray, np.ndarray]:
+    """Маски ходящего игрока и оппонента для каждой позиции"""
+    own = np.fromiter((b.own for b in boards), dtype=np.uint16, count=len(boards))
+    opponent = np.fromiter((b.opponent for b in boards), dtype=np.uint16, count=len(boards))
+    return own, opponent
+
+
+def winners(masks: np.ndarray) -> np.ndarray:
+    """Для каждой маски - есть ли в ней выигрышная линия"""
+    return ((masks[:, None] & LINES) == LINES).any(axis=1)
+
+
+def random_moves(own: np.ndarray, opponent: np.ndarray,
+                 rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Случайная свободная ячейка для каждой позиции (0, если свободных нет).
+    Из случайных чисел, обнулённых для занятых ячеек, берётся максимальное
+    """
+    rng = rng or np.random.default_rng()
+    empty = ~(own | opponent) & FULL_MASK
+    legal = (empty[:, None] >> BITS) & 1
+    weights = rng.random(legal.shape) * legal
+    moves = weights.argmax(axis=1) + 1
+    return np.where(legal.any(axis=1), moves, 0)
+
+
+def table_moves(own: np.ndarray, opponent: np.ndarray) -> np.ndarray:
+    """Лучший ход из таблицы решённых позиций (0 для позиций вне таблицы)"""
+    index = own.astype(np.int64) << 9 | opponent
+    return get_best_moves()[index].astype(np.int64)
+
+
+def move_many(boards: Sequence[BitBoard], difficulty: str) -> list[int]:
+    """
+    Ходы ИИ для пакета позиций 3x3 одной сложности.
+    Для сложностей без векторной реализации ходы считаются по одному
+    """
+    if not boards:
+        return []
+    if difficulty not in BATCH_DIFFICULTIES:
+        return [AI_MAPPING[difficulty](board).move() for board in boards]
+
+    own, opponent = encode(boards)
+    if difficulty == Difficulty.EASY:
+        moves = random_moves(own, opponent)
+    else:
+        moves = table_moves(own, opponent)
+        missing = np.flatnonzero(moves == 0)
+        for i in missing:
+            moves[i] = AI_MAPPING[difficulty](boards[i]).move()
+    return moves.tolist()
+
+
+class MoveBatcher:
+    """
+    Собирает запросы ходов в течение window_ms (или до max_batch штук)
+    и вычисляет их одним вызовом move_many
+    """
+
+    def __init__(self, window_ms: int, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: defaultdict[str, list[tuple[BitBoard, asyncio.Future]]] = defaultdict(list)
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.moves = 0
+
+    @staticmethod
+    def supports(cells: BitBoard, difficulty: str) -> bool:
+        return difficulty in BATCH_DIFFICULTIES and cells.geometry is CLASSIC
+
+    async def move(self, cells: BitBoard, difficulty: str) -> int:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue[difficulty].append((cells, future))
+        self.size += 1
+        if self.size >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        queue, self.queue = self.queue, defaultdict(list)
+        self.size = 0
+        for difficulty, requests in queue.items():
+            try:
+                moves = move_many([cells for cells, _ in requests], difficulty)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), move in zip(requests, moves):
+                if not future.done():
+                    future.set_result(move)
+            self.batches += 1
+            self.moves += len(requests)
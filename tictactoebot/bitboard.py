@@ -0,0 +1,220 @@
+"""
+Битовое представление игрового поля.
+
+Ячейке с индексом i (1..size*size, построчно) соответствует бит 1 << (i - 1).
+Поле хранится в виде двух масок (по одной на игрока)
+и номера игрока, который ходит следующим.
+Классическое поле 3x3 описывается константами модуля,
+поля N×N с k в ряд - объектом Geometry.
+"""
+from functools import cache
+from typing import Iterator, Optional
+
+
+CELLS = range(1, 10)
+FULL_MASK = 0b111_111_111
+
+WINNING_COMBINATIONS = (
+    (1, 2, 3), (4, 5, 6), (7, 8, 9),
+    (1, 4, 7), (2, 5, 8), (3, 6, 9),
+    (1, 5, 9), (3, 5, 7),
+)
+
+
+def cell_bit(index: int) -> int:
+    return 1 << (index - 1)
+
+
+LINE_MASKS = tuple(
+    sum(cell_bit(i) for i in combination) for combination in WINNING_COMBINATIONS
+)
+
+# WIN_MASKS[mask] истинно, если в маске есть выигрышная линия
+WIN_MASKS = tuple(
+    any(mask & line == line for line in LINE_MASKS) for mask in range(FULL_MASK + 1)
+)
+
+
+def is_win(mask: int) -> bool:
+    return WIN_MASKS[mask]
+
+
+def iter_cells(mask: int) -> Iterator[int]:
+    """Индексы ячеек, биты которых установлены в маске, по возрастанию"""
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length()
+        mask ^= bit
+
+
+class Geometry:
+    """
+    Размеры поля и выигрышные линии для игры N×N с k в ряд
+    """
+    __slots__ = (
+        "size", "k", "cells", "full_mask", "move_bits",
+        "line_masks", "cell_lines", "cell_weights", "_win_table",
+    )
+
+    def __init__(self, size: int = 3, k: Optional[int] = None):
+        self.size = size
+        self.k = k or size
+        if not 1 <= self.k <= size:
+            raise ValueError(f"k must be in 1..{size}, got {self.k}")
+        self.cells = range(1, size * size + 1)
+        self.full_mask = (1 << size * size) - 1
+        # Бит на один ход в записи партии: номер ячейки минус один
+        self.move_bits = (size * size - 1).bit_length()
+
+        lines = []
+        for row in range(size):
+            for column in range(size):
+                for d_row, d_column in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row = row + d_row * (self.k - 1)
+                    end_column = column + d_column * (self.k - 1)
+                    if not (0 <= end_row < size and 0 <= end_column < size):
+                        continue
+                    lines.append(sum(
+                        1 << (row + d_row * step) * size + column + d_column * step
+                        for step in range(self.k)
+                    ))
+        self.line_masks = tuple(lines)
+        # Линии, проходящие через каждую ячейку (индекс 0 не используется)
+        self.cell_lines = ((),) + tuple(
+            tuple(line for line in lines if line & cell_bit(i)) for i in self.cells
+        )
+        self.cell_weights = (0,) + tuple(len(self.cell_lines[i]) for i in self.cells)
+        self._win_table = WIN_MASKS if (size, self.k) == (3, 3) else None
+
+    def __repr__(self) -> str:
+        return f"Geometry(size={self.size}, k={self.k})"
+
+    def is_win(self, mask: int) -> bool:
+        if self._win_table is not None:
+            return self._win_table[mask]
+        return any(mask & line == line for line in self.line_masks)
+
+    def is_win_at(self, mask: int, index: int) -> bool:
+        """Проверяет только линии, проходящие через ячейку index"""
+        return any(mask & line == line for line in self.cell_lines[index])
+
+
+def get_geometry(size: int = 3, k: Optional[int] = None) -> Geometry:
+    """Возвращает общий для процесса объект Geometry для поля size x size"""
+    return _get_geometry(size, k or size)
+
+
+@cache
+def _get_geometry(size: int, k: int) -> Geometry:
+    return Geometry(size, k)
+
+
+CLASSIC = get_geometry(3, 3)
+
+
+class BitBoard:
+    """
+    Игровое поле из двух масок.
+    first - ячейки первого игрока (0), second - второго (1),
+    turn - номер игрока (0 или 1), который ходит следующим.
+    """
+    __slots__ = ("first", "second", "turn", "geometry")
+
+    def __init__(self, first: int = 0, second: int = 0, turn: int = 0,
+                 geometry: Geometry = CLASSIC):
+        self.first = first
+        self.second = second
+        self.turn = turn
+        self.geometry = geometry
+
+    def __repr__(self) -> str:
+        return (
+            f"BitBoard({self.first:#b}, {self.second:#b}, "
+            f"turn={self.turn}, geometry={self.geometry})"
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return (
+            self.first == other.first and self.second == other.second
+            and self.turn == other.turn and self.geometry is other.geometry
+        )
+
+    @classmethod
+    def from_dict(cls, board: dict[int, int],
+                  geometry: Geometry = CLASSIC) -> "BitBoard":
+        """
+        Строит поле из словаря вида {индекс: значение},
+        где 1 - ходящий игрок, -1 - оппонент, 0 - пустая ячейка
+        """
+        own = sum(cell_bit(i) for i, v in board.items() if v == 1)
+        opponent = sum(cell_bit(i) for i, v in board.items() if v == -1)
+        return cls(own, opponent, 0, geometry)
+
+    def copy(self) -> "BitBoard":
+        return BitBoard(self.first, self.second, self.turn, self.geometry)
+
+    @property
+    def masks(self) -> tuple[int, int]:
+        return self.first, self.second
+
+    def mask(self, player: int) -> int:
+        return self.second if player else self.first
+
+    @property
+    def own(self) -> int:
+        """Маска игрока, который ходит следующим"""
+        return self.second if self.turn else self.first
+
+    @property
+    def opponent(self) -> int:
+        return self.first if self.turn else self.second
+
+    @property
+    def occupied(self) -> int:
+        return self.first | self.second
+
+    @property
+    def empty(self) -> int:
+        return self.geometry.full_mask & ~(self.first | self.second)
+
+    def get(self, index: int) -> int:
+        """Номер игрока (0 или 1), занявшего ячейку, или -1 для пустой"""
+        bit = cell_bit(index)
+        if self.first & bit:
+            return 0
+        if self.second & bit:
+            return 1
+        return -1
+
+    def is_cell_empty(self, index: int) -> bool:
+        return not self.occupied & cell_bit(index)
+
+    def set(self, index: int, player: int):
+        """Ставит в ячейку символ игрока, -1 очищает ячейку"""
+        bit = cell_bit(index)
+        self.first &= ~bit
+        self.second &= ~bit
+        if player == 0:
+            self.first |= bit
+        elif player == 1:
+            self.second |= bit
+
+    def play(self, index: int):
+        """Делает ход игроком turn и передаёт ход сопернику"""
+        self.set(index, self.turn)
+        self.turn ^= 1
+
+    def free_cells(self) -> list[int]:
+        return list(iter_cells(self.empty))
+
+    def is_winner(self, player: int) -> bool:
+        return self.geometry.is_win(self.mask(player))
+
+    def is_full(self) -> bool:
+        return self.occupied == self.geometry.full_mask
+
+    def clear(self):
+        self.first = self.second = 0
+        self.turn = 0
@@ -0,0 +1,73 @@
+"""
+Последовательная обработка нажатий на одно поле.
+"""
+import time
+from asyncio import Lock
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class BoardLocks:
+    """
+    Замок на каждое поле: нажатия на одно поле обрабатываются по очереди,
+    нажатия на разные поля - параллельно.
+    Замок удаляется, когда его никто не держит и не ждёт,
+    поэтому замков не больше, чем полей с необработанными нажатиями.
+    """
+    WAIT_WINDOW = 10_000
+
+    def __init__(self):
+        # board_id -> [замок, число держащих и ждущих]
+        self.locks: dict[int, list] = {}
+        self.acquired = 0
+        self.contended = 0
+        self.max_wait = 0.0
+        self.waits: deque[float] = deque(maxlen=self.WAIT_WINDOW)
+
+    def __len__(self) -> int:
+        return len(self.locks)
+
+    @asynccontextmanager
+    async def hold(self, board_id: int):
+        entry = self.locks.get(board_id)
+        if entry is None:
+            entry = self.locks[board_id] = [Lock(), 0]
+        entry[1] += 1
+        lock = entry[0]
+        try:
+            if lock.locked():
+                self.contended += 1
+                started = time.perf_counter()
+                await lock.acquire()
+                wait = time.perf_counter() - started
+                self.max_wait = max(self.max_wait, wait)
+            else:
+                await lock.acquire()
+                wait = 0.0
+            self.waits.append(wait)
+            self.acquired += 1
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[board_id]
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        return {
+            "locks": len(self.locks),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p99_ms": percentile(0.99),
+            "wait_max_ms": self.max_wait * 1000,
+        }
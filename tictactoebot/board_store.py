@@ -0,0 +1,170 @@
+"""
+Хранилище активных игровых полей с вытеснением неактивных партий.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from .clock import monotonic
+from .config import (
+    BOARD_STORE_MAX_SIZE, BOARD_TTL_SECONDS, BOARD_SWEEP_INTERVAL,
+    BOT_WORKERS, WORKER_INDEX,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор поля попадает в callback_data кнопок, 31 бита хватает с запасом
+BOARD_ID_BITS = 31
+# Сколько id процесс может выдать между двумя снимками: граница выданных id
+# сохраняется с этим запасом, чтобы после падения бота id не повторились
+BOARD_ID_RESERVE = 100_000
+
+
+def shard_of(key: int, shards: int) -> int:
+    """
+    Номер процесса бота, который обслуживает поле или пользователя с id key.
+    Умножение на нечётную константу перемешивает биты близких id
+    """
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * shards >> 64
+
+
+class BoardStore:
+    """
+    Поля в порядке последней активности (LRU).
+    Поле вытесняется, если к нему не обращались дольше ttl секунд
+    или если при добавлении нового поля превышен max_size.
+    Идентификаторы выдаются по возрастанию после last_id, который
+    при старте берётся из снимков (Snapshotter.last_board_id), поэтому
+    новое поле не получит id сохранённого или удалённого поля
+    и после перезапуска бота.
+    При нескольких процессах бота каждый пропускает id,
+    которые принадлежат другим процессам (shard_of).
+    Изменённые и удалённые с прошлого снимка поля накапливаются
+    в dirty и deleted (см. snapshots.Snapshotter).
+    """
+
+    def __init__(self, max_size: int = BOARD_STORE_MAX_SIZE,
+                 ttl: float = BOARD_TTL_SECONDS,
+                 worker_index: int = WORKER_INDEX, workers: int = BOT_WORKERS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.worker_index = worker_index
+        self.workers = workers
+        self.last_id = 0
+        self.boards: OrderedDict[int, object] = OrderedDict()
+        self.last_active: dict[int, float] = {}
+        self.dirty: set[int] = set()
+        self.deleted: set[int] = set()
+        self.evicted_idle = 0
+        self.evicted_full = 0
+        self.removed = 0
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    def __contains__(self, board_id: int) -> bool:
+        return board_id in self.boards
+
+    def new_id(self) -> int:
+        board_id = self.last_id
+        while True:
+            board_id = board_id % ((1 << BOARD_ID_BITS) - 1) + 1
+            if board_id not in self.boards and \
+                    shard_of(board_id, self.workers) == self.worker_index:
+                self.last_id = board_id
+                return board_id
+
+    def seed_ids(self, last_id: int):
+        """Новые id будут больше last_id"""
+        self.last_id = max(self.last_id, last_id)
+
+    def id_watermark(self) -> int:
+        """Граница выданных id с запасом на поля, созданные до следующего снимка"""
+        return self.last_id + BOARD_ID_RESERVE * self.workers
+
+    def add(self, board_id: int, board):
+        self.restore(board_id, board)
+        self.dirty.add(board_id)
+        # Новое поле могло получить id поля, удаление которого ещё не записано
+        self.deleted.discard(board_id)
+
+    def restore(self, board_id: int, board):
+        """Добавляет поле, загруженное из снимка, не помечая его изменённым"""
+        self.boards[board_id] = board
+        self.boards.move_to_end(board_id)
+        self.last_active[board_id] = monotonic()
+        while len(self.boards) > self.max_size:
+            old_id, _ = self.boards.popitem(last=False)
+            self.forget(old_id)
+            self.evicted_full += 1
+
+    def get(self, board_id: int):
+        """
+        Возвращает поле и отмечает его активность, None для неизвестного id.
+        Полученное поле считается изменённым: обработчики берут поле, чтобы сделать ход
+        """
+        board = self.boards.get(board_id)
+        if board is not None:
+            self.boards.move_to_end(board_id)
+            self.last_active[board_id] = monotonic()
+            self.dirty.add(board_id)
+        return board
+
+    def remove(self, board_id: int):
+        if self.boards.pop(board_id, None) is not None:
+            self.forget(board_id)
+            self.removed += 1
+
+    def forget(self, board_id: int):
+        del self.last_active[board_id]
+        self.dirty.discard(board_id)
+        self.deleted.add(board_id)
+
+    def drain_changes(self) -> tuple[list, set[int]]:
+        """
+        Изменённые поля с прошлого вызова и id удалённых полей.
+        Удалённые остаются в deleted, пока их удаление не записано
+        (deletes_written): до этого снимок не должен вернуть поле в игру
+        """
+        boards = [self.boards[board_id] for board_id in self.dirty]
+        self.dirty = set()
+        return boards, set(self.deleted)
+
+    def deletes_written(self, deleted: set[int]):
+        self.deleted -= deleted
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Вытесняет поля, неактивные дольше ttl.
+        Поля упорядочены по активности, поэтому проверка идёт
+        с начала до первого свежего поля
+        """
+        now = monotonic() if now is None else now
+        evicted = 0
+        while self.boards:
+            board_id = next(iter(self.boards))
+            if now - self.last_active[board_id] < self.ttl:
+                break
+            del self.boards[board_id]
+            self.forget(board_id)
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    async def run_sweeper(self, interval: float = BOARD_SWEEP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.sweep()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle boards, {len(self)} left")
+
+    def stats(self) -> dict:
+        return {
+            "boards": len(self.boards),
+            "max_size": self.max_size,
+            "evicted_idle": self.evicted_idle,
+            "evicted_full": self.evicted_full,
+            "removed": self.removed,
+        }
@@ -5,6 +5,7 @@ from aiogram.enums import ParseMode
 from .translate import get_languages_dict
 from .config import BOT_TOKEN
 from tictactoebot.data import DATA_GAME
+from .ai_pool import AI_POOL
 from .filters import InviteFilter
 from .keyboards import make_board_keyboard
 from tictactoebot.enums import Symbol
@@ -26,7 +27,7 @@ async def on_invite_btn(query: types.CallbackQuery, callback_data: InviteFilter)
     author_name = author_obj.full_name
     target_name = query.from_user.full_name
 
-    board = DATA_GAME.init_game(
+    board = await DATA_GAME.init_game(
         callback_data.author, query.from_user.id,
         author_name, target_name,
         Symbol.CROSS, Symbol.ZERO
@@ -41,12 +42,12 @@ async def on_invite_btn(query: types.CallbackQuery, callback_data: InviteFilter)
 
 async def _start_game(author_id, target_id, player_symbol, bot_symbol, message: types.Message):
     username = message.chat.full_name
-    board = DATA_GAME.init_game(
+    board = await DATA_GAME.init_game(
         author_id, target_id,
         username, 'Bot',
         player_symbol, bot_symbol
     )
-    user = DATA_GAME.get_user(author_id)
+    user = await DATA_GAME.get_user(author_id)
     score = user.score
 
     message_text = translate(
@@ -77,15 +78,29 @@ async def on_choice_key_pressed(query: CallbackQuery, callback_data: PickFilter)
 @router.callback_query(FieldFilter.filter(F.index > 0))
 async def on_board_pressed(query: CallbackQuery, callback_data: FieldFilter):
     """
-    Функция, запускающаяся при нажатии на любую клетку на поле
+    Функция, запускающаяся при нажатии на любую клетку на поле.
+    Нажатия на одно поле обрабатываются по очереди, иначе два быстрых
+    нажатия могут оба пройти проверку хода
     """
+    async with DATA_GAME.board_locks.hold(callback_data.board_id):
+        await _handle_board_press(query, callback_data)
+
+
+async def _handle_board_press(query: CallbackQuery, callback_data: FieldFilter):
     message = query.message
 
     # Получаем игровое поле по его айди, записанном в кнопке
-    board = DATA_GAME.get_board(callback_data.board_id)
+    board = await DATA_GAME.load_board(callback_data.board_id)
     # Получаем айди пользователя, нажавшего на кнопку
     user_id = query.from_user.id
-    
+
+    # Поле могло быть удалено после окончания игры или вытеснено по таймауту
+    if board is None:
+        user = await DATA_GAME.get_user(user_id)
+        language = user.language if user else query.from_user.language_code
+        await query.answer(translate(language, "game.expired"))
+        return
+
     # Если айди пользователя не совпадает с игроками, записанными в поле, то 
     # пропускаем это нажатие и завершаем функцию
     if not user_id in (board.author_id, board.target_id):
@@ -97,7 +112,7 @@ async def on_board_pressed(query: CallbackQuery, callback_data: FieldFilter):
 
     # Получаем класс пользователя, его имя и счет
     player_name = query.from_user.full_name
-    user = DATA_GAME.get_user(user_id)
+    user = await DATA_GAME.get_or_create_user(user_id)
     score = user.score
 
     # Если нажатая клетка не пустая, то пропускаем действие
@@ -109,7 +124,7 @@ async def on_board_pressed(query: CallbackQuery, callback_data: FieldFilter):
     board.user_step(user_id, callback_data.index)
     # Если айди противника - 0 (он бот), то делаем за него ход
     if board.target_id == 0:
-        board.bot_step(user.difficulty)
+        await AI_POOL.bot_step(board, user.difficulty)
 
     if user_id == board.author_id:
         next_step_user_name = board.target_name
@@ -130,8 +145,11 @@ async def on_board_pressed(query: CallbackQuery, callback_data: FieldFilter):
         ) 
 
     # Проверяем победителя, если кто-то победил - удаляем поле и редактируем сообщение
+    if board.is_over():
+        await DATA_GAME.finish_game(board, user.difficulty)
     winner = board.end_game(player_name, "target", user.language)
     if winner:
+        DATA_GAME.remove_board(board.board_id)
         score_text = get_translate(user.language)["main_reply"]
         if message is None: # Если используется inline сообщение (100% мультиплеер)
             await bot.edit_message_reply_markup(
@@ -165,7 +183,7 @@ async def _send_menu(message, code):
 async def on_menu_btn(query: CallbackQuery, callback_data: MenuFilter) :
     message = query.message
     user_id = query.from_user.id
-    user = DATA_GAME.get_user(user_id)
+    user = await DATA_GAME.get_or_create_user(user_id)
     username = message.chat.full_name
     action = callback_data.action
     
@@ -183,6 +201,8 @@ async def on_menu_btn(query: CallbackQuery, callback_data: MenuFilter) :
             user.difficulty, user.score.player,
             user.score.bot, user.score.enemy,
             user.score.draw)
+        place, wins = DATA_GAME.leaderboard.rank(user.user_id)
+        text += "\n" + translate(user.language, 'profile.rank').format(place, wins)
         await message.edit_text(
         text, reply_markup=make_back_kb(user.language),
         parse_mode = ParseMode.HTML
@@ -209,7 +229,7 @@ async def on_language_picked(query: CallbackQuery, callback_data: LanguageFilter
     code = callback_data.code
     user_id = query.from_user.id
 
-    DATA_GAME.change_user_language(user_id, code)
+    await DATA_GAME.change_user_language(user_id, code)
 
     await _send_menu(query.message, code)
 
@@ -221,8 +241,8 @@ async def on_difficulty_picked(query: CallbackQuery, callback_data: DifficultyFi
 
     level = callback_data.level
     user_id = query.from_user.id
-    DATA_GAME.change_user_difficulty(user_id, level)
-    user = DATA_GAME.get_user(user_id)
+    await DATA_GAME.change_user_difficulty(user_id, level)
+    user = await DATA_GAME.get_or_create_user(user_id)
     language = user.language
 
     await _send_menu (query.message, language)
\ No newline at end of file
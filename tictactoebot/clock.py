@@ -0,0 +1,22 @@
+"""
+Грубые часы для отметок времени в кэшах.
+"""
+import time
+
+
+RESOLUTION = 1.0
+
+_now = 0.0
+
+
+def monotonic() -> float:
+    """
+    time.monotonic() с точностью до RESOLUTION секунд.
+    Отметки одной секунды - один и тот же объект float,
+    поэтому миллион записей кэша не держит миллион чисел по 24 байта
+    """
+    global _now
+    now = time.monotonic()
+    if now - _now >= RESOLUTION:
+        _now = now
+    return _now
@@ -1,4 +1,7 @@
+import html
+
 from aiogram import Router, types
+from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 
 from . import get_translate, get_languages_dict, translate, make_lang_kb, make_difficulty_kb, make_menu_keyboard
@@ -7,6 +10,8 @@ from tictactoebot.data import DATA_GAME
 
 router = Router()
 
+TOP_SIZE = 10
+
 
 async def _send_pick_lang(message: types.Message, code: str):
     text = get_translate(code)["pick_lang"]
@@ -20,32 +25,52 @@ async def _send_pick_difficulty(message: types.Message, code: str):
 
 @router.message(Command("profile"))
 async def on_profile(message:types.Message) :
-    user = DATA_GAME.get_user(message.from_user.id)
+    user = await DATA_GAME.get_or_create_user(message.from_user.id)
     username = message.chat.full_name
 
     text = translate(user.language, 'profile')
-    text = text.format (username, user.language, user.difficulty)
-    await message.reply(text)
+    text = text.format (html.escape(username), user.language, user.difficulty)
+    place, wins = DATA_GAME.leaderboard.rank(user.user_id)
+    text += "\n" + translate(user.language, 'profile.rank').format(place, wins)
+    await message.reply(text, parse_mode=ParseMode.HTML)
+
+
+@router.message(Command("top"))
+async def on_top(message: types.Message):
+    user = await DATA_GAME.get_or_create_user(message.from_user.id)
+    top = DATA_GAME.leaderboard.top(TOP_SIZE)
+    if not top:
+        await message.reply(translate(user.language, 'top.empty'))
+        return
+
+    line = translate(user.language, 'top.line')
+    lines = [translate(user.language, 'top')]
+    for place, user_id, wins in top:
+        player = await DATA_GAME.get_user(user_id)
+        name = player.name if player is not None and player.name else str(user_id)
+        lines.append(line.format(place, name, wins))
+    await message.reply("\n".join(lines))
 
 @router.message(Command("languages"))
 async def on_change_lang(message: types.Message):
-    code = DATA_GAME.get_user(message.from_user.id).language
+    code = (await DATA_GAME.get_or_create_user(message.from_user.id)).language
     await _send_pick_lang(message, code)
 
 
 @router.message(Command("difficulty"))
 async def on_change_difficulty(message: types.Message):
-    code = DATA_GAME.get_user(message.from_user.id).difficulty
+    code = (await DATA_GAME.get_or_create_user(message.from_user.id)).difficulty
     await _send_pick_difficulty(message, code)
 
 @router.message(CommandStart())
 async def send_welcome(message: types.Message):
     user_id = message.from_user.id
-    if DATA_GAME.has_user(user_id):
-        code = DATA_GAME.get_user(user_id).language
+    user = await DATA_GAME.get_user(user_id)
+    if user is not None:
+        code = user.language
         await message.answer(
             text=translate(code, "welcome"), reply_markup=make_menu_keyboard(code)
         )
     else:
-        DATA_GAME.add_user(message.from_user.id)
+        await DATA_GAME.add_user(message.from_user.id)
         await _send_pick_lang(message, message.from_user.language_code)
\ No newline at end of file
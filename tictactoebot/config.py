@@ -9,6 +9,71 @@ BOT_TOKEN = os.getenv('TTT_API_TOKEN')
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
+# Максимальное время на ход NegamaxAI в миллисекундах
+AI_MOVE_BUDGET_MS = int(os.getenv('AI_MOVE_BUDGET_MS', 500))
+
+# Число процессов бота (см. workers.py) и номер текущего процесса
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 1))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', 0))
+
+# Пул для вычисления ходов ИИ вне цикла событий: process или thread.
+# Ядра делятся между процессами бота
+AI_POOL_KIND = os.getenv('AI_POOL_KIND', 'process')
+AI_POOL_SIZE = int(os.getenv('AI_POOL_SIZE', max(1, (os.cpu_count() or 1) // BOT_WORKERS)))
+# Максимальное число ходов, ожидающих пула, остальные получают запасной ход
+AI_POOL_MAX_PENDING = int(os.getenv('AI_POOL_MAX_PENDING', 1000))
+AI_MOVE_TIMEOUT_MS = int(os.getenv('AI_MOVE_TIMEOUT_MS', 2000))
+# Окно сбора ходов для пакетного вычисления на NumPy (0 - выключено)
+AI_BATCH_WINDOW_MS = int(os.getenv('AI_BATCH_WINDOW_MS', 0))
+AI_BATCH_MAX_SIZE = int(os.getenv('AI_BATCH_MAX_SIZE', 4096))
+# Интервал записи статистики компонентов в лог (0 - только при остановке)
+STATS_LOG_INTERVAL = float(os.getenv('STATS_LOG_INTERVAL', 300))
+
+# Активные партии: неактивные дольше BOARD_TTL_SECONDS вытесняются
+BOARD_TTL_SECONDS = int(os.getenv('BOARD_TTL_SECONDS', 60 * 60))
+BOARD_STORE_MAX_SIZE = int(os.getenv('BOARD_STORE_MAX_SIZE', 1_000_000))
+BOARD_SWEEP_INTERVAL = int(os.getenv('BOARD_SWEEP_INTERVAL', 60))
+
+# Соединения SQLite: журнал WAL, чтобы чтение не ждало запись
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16 * 1024))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+# Потоки для чтения пользователей, у каждого своё соединение
+DB_READERS = int(os.getenv('DB_READERS', 2))
+
+# Кэш пользователей: отсутствие пользователя в базе кэшируется на меньший срок
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 100_000))
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 60 * 60))
+USER_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv('USER_CACHE_NEGATIVE_TTL_SECONDS', 60))
+
+# Отложенная запись настроек и счёта: одна транзакция раз в интервал
+# или после указанного числа изменений
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv('WRITE_BEHIND_INTERVAL_MS', 200))
+WRITE_BEHIND_MAX_RECORDS = int(os.getenv('WRITE_BEHIND_MAX_RECORDS', 1000))
+
+# Журнал сыгранных партий пишется пакетами
+GAME_LOG_BATCH_SIZE = int(os.getenv('GAME_LOG_BATCH_SIZE', 500))
+GAME_LOG_FLUSH_INTERVAL = float(os.getenv('GAME_LOG_FLUSH_INTERVAL', 10))
+
+# Хранилище пользователей и счёта: sqlite, memory или localkv (см. storage.py).
+# localkv - заменитель сетевого хранилища с задержкой STORAGE_KV_LATENCY_MS на запрос
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+STORAGE_KV_LATENCY_MS = float(os.getenv('STORAGE_KV_LATENCY_MS', 0.5))
+
+# Рейтинг игроков перечитывается из базы с этим интервалом (0 - никогда).
+# При BOT_WORKERS > 1 каждый процесс видит только свои изменения счёта,
+# поэтому по умолчанию рейтинг тогда перечитывается раз в 30 секунд
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv(
+    'LEADERBOARD_REFRESH_SECONDS', 30 if BOT_WORKERS > 1 else 0
+))
+
+# Снимки активных партий для восстановления после перезапуска
+SNAPSHOT_DB_NAME = os.getenv('SNAPSHOT_DB_NAME', 'boards.db')
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 5))
+
+# Файл таблицы эндшпилей 4x4 (python -m tictactoebot.tablebase generate)
+TABLEBASE_PATH = os.getenv('TABLEBASE_PATH', 'tablebase_4x4.bin')
+
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': False,
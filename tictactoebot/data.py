@@ -1,14 +1,29 @@
+import asyncio
+import logging
+import sys
 from copy import deepcopy
 from dataclasses import dataclass, field
 from typing import Optional
 
 from .translate import get_translate
 from .ai import *
+from .bitboard import BitBoard, get_geometry
 from .enums import *
-from .db import Database, DB_NAME
+from .board_locks import BoardLocks
+from .board_store import BoardStore
+from .game_log import GameLog
+from .leaderboard import Leaderboard
+from .snapshots import Snapshotter
+from .user_cache import MISS, UserCache
+from .write_behind import WriteBehind
+from .storage import game_log_database, open_storage, snapshot_database
+from .config import STATS_LOG_INTERVAL
 
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
 class Score:
     user_id: int = 0
     player: int = 0
@@ -21,29 +36,34 @@ class Score:
         return cls(*data[1:])
 
 
-@dataclass
+@dataclass(slots=True)
 class Stats:
     hard_bot_win_count: int = 0
     easy_bot_defeat_count: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class UserData:
     user_id: int
     language: str = Language.ENGLISH
     difficulty: str = Difficulty.EASY
     score: Score = field(default_factory=lambda: Score())
     stats: Stats = field(default_factory=lambda: Stats())
+    target_id: int = 0
+    name: Optional[str] = None
 
     def copy(self):
         return deepcopy(self)
 
     @classmethod
     def from_tuple(cls, data: tuple):
+        # Короткие строки настроек одинаковы у всех пользователей,
+        # интернирование оставляет в памяти по одной копии
         return cls(
             user_id=data[1],
-            language=data[2],
-            difficulty=data[3]
+            language=sys.intern(data[2]),
+            difficulty=sys.intern(data[3]),
+            name=data[5] if len(data) > 5 else None,
         )
 
     @classmethod
@@ -55,7 +75,7 @@ class UserData:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Board:
     board_id: int
     author_id: int
@@ -64,91 +84,128 @@ class Board:
     target_name: str
     author_symbol: Symbol
     target_symbol: Symbol
-    data: dict[int, Symbol] = field(default_factory=lambda: dict())
+    # first - ячейки автора, second - ячейки второго игрока (или бота)
+    cells: BitBoard = field(default_factory=BitBoard)
     next_step: int = 0
+    # Число занятых ячеек и итог партии, обновляются после каждого хода
+    moves: int = 0
+    result: GameResult = GameResult.NONE
+    # Ходы по порядку, по geometry.move_bits бит на ход (см. game_log.py)
+    history: int = 0
 
+    AUTHOR, TARGET = 0, 1
 
     def user_step(self, user_id: int, index: int):
         """
         Проверяет есть ли уже символ отличный от пустого
         в случае если он не задан устанавливает символ игрока
         """
-        symbol = Symbol.EMPTY
         if user_id == self.author_id:
-            symbol = self.author_symbol
+            player = self.AUTHOR
             self.next_step = self.target_id
         else:
-            symbol = self.target_symbol
+            player = self.TARGET
             self.next_step = self.author_id
 
         if self.is_cell_empty(index):
-            self.set_cell(index, symbol)
+            self.cells.set(index, player)
+            self.cells.turn = player ^ 1
+            self.update_result(index, player)
+
+    def update_result(self, index: int, player: int):
+        """
+        Обновляет итог после хода player в ячейку index.
+        Проверяются только линии, проходящие через эту ячейку
+        """
+        cells = self.cells
+        self.history |= (index - 1) << (cells.geometry.move_bits * self.moves)
+        self.moves += 1
+        if cells.geometry.is_win_at(cells.mask(player), index):
+            self.result = GameResult.AUTHOR if player == self.AUTHOR else GameResult.TARGET
+        elif self.moves == len(cells.geometry.cells):
+            self.result = GameResult.DRAW
+
+    def is_over(self) -> bool:
+        return self.result != GameResult.NONE
 
     def is_cell_empty(self, index: int) -> bool:
-        if self.data[index] == Symbol.EMPTY:
-            return True
-        return False
+        return self.cells.is_cell_empty(index)
 
     def set_cell(self, index: int, symbol: Symbol):
-        self.data[index] = symbol
+        if symbol == self.author_symbol:
+            self.cells.set(index, self.AUTHOR)
+        elif symbol == self.target_symbol:
+            self.cells.set(index, self.TARGET)
+        else:
+            self.cells.set(index, -1)
+        # Произвольная расстановка: итог пересчитывается целиком
+        self.moves = self.cells.occupied.bit_count()
+        if self.cells.is_winner(self.AUTHOR):
+            self.result = GameResult.AUTHOR
+        elif self.cells.is_winner(self.TARGET):
+            self.result = GameResult.TARGET
+        elif self.cells.is_full():
+            self.result = GameResult.DRAW
+        else:
+            self.result = GameResult.NONE
 
     def get_cell(self, index: int) -> Symbol:
-        return self.data[index]
+        player = self.cells.get(index)
+        if player == self.AUTHOR:
+            return self.author_symbol
+        if player == self.TARGET:
+            return self.target_symbol
+        return Symbol.EMPTY
 
     def bot_step(self, difficulty):
         """
         Делает ход ИИ
         """
-        empty_cells = self.get_free_positions()
-        if len(empty_cells) == 0:
-            return
+        move = self.get_bot_move(difficulty)
+        if move is not None:
+            self.apply_bot_move(move)
 
-        ai_board = {
-            i: self.get_cell_value_for_ai(self.get_cell(i)) for i in range(1, 10)
-        }
-        ai_mapping = {
-            Difficulty.EASY: RandomAI,
-            Difficulty.HARD: MiniMaxAI
-        }
-        move = ai_mapping[difficulty](ai_board).move()  
-        self.set_cell(move, self.target_symbol)
+    def get_bot_move(self, difficulty) -> Optional[int]:
+        """
+        Вычисляет ход ИИ, не изменяя поле.
+        Возвращает None, если партия уже закончена
+        """
+        if self.is_over():
+            return None
+        cells = self.bot_cells()
+        return AI_MAPPING[difficulty].create(cells, difficulty, self.board_id).move()
+
+    def bot_cells(self) -> BitBoard:
+        """Копия поля, на которой ходит бот"""
+        cells = self.cells.copy()
+        cells.turn = self.TARGET
+        return cells
+
+    def apply_bot_move(self, move: int):
+        self.cells.turn = self.TARGET
+        self.cells.play(move)
         self.next_step = self.author_id
-
-    def get_cell_value_for_ai(self, value: Symbol) -> int:
-        if value == self.target_symbol:
-            return 1
-        if value == self.author_symbol:
-            return -1
-        if value == Symbol.EMPTY:
-            return 0
-        raise ValueError
+        self.update_result(move, self.TARGET)
 
     def get_free_positions(self) -> list:
         """Получение списка доступных ходов на игровом поле"""
-        return [index for index in self.data.keys() if self.is_cell_empty(index)]
+        return self.cells.free_cells()
 
     def is_target_winner(self) -> bool:
-        return self.is_winner(self.target_symbol)
+        return self.result == GameResult.TARGET
 
     def is_author_winner(self) -> bool:
-        return self.is_winner(self.author_symbol)
+        return self.result == GameResult.AUTHOR
 
     def is_winner(self, le):
         """
-        При задании доски и символа игрока эта функция возвращает True, если игрок выиграл.
-        Мы используем bo вместо data и le вместо letter, чтобы не набирать много текста.
+        При задании символа игрока эта функция возвращает True, если игрок выиграл.
         """
-        bo = self.data
-        return (
-            (bo[7] == le and bo[8] == le and bo[9] == le)
-            or (bo[4] == le and bo[5] == le and bo[6] == le)
-            or (bo[1] == le and bo[2] == le and bo[3] == le)
-            or (bo[7] == le and bo[4] == le and bo[1] == le)
-            or (bo[8] == le and bo[5] == le and bo[2] == le)
-            or (bo[9] == le and bo[6] == le and bo[3] == le)
-            or (bo[7] == le and bo[5] == le and bo[3] == le)
-            or (bo[9] == le and bo[5] == le and bo[1] == le)
-        )
+        if le == self.author_symbol:
+            return self.is_author_winner()
+        if le == self.target_symbol:
+            return self.is_target_winner()
+        return False
 
     def end_game(self, author_name, target_name, language) -> Optional[str]:
         """
@@ -168,8 +225,7 @@ class Board:
             end_game_text = get_translate(language)["win.bot"]
             return end_game_text
 
-        values = list(self.data.values())
-        if not Symbol.EMPTY in values:
+        if self.result == GameResult.DRAW:
             self.clear()
             #self.score.draw += 1
             end_game_text = get_translate(language)["draw"]
@@ -193,82 +249,238 @@ class Board:
         return board
 
     def clear(self):
-        for i in range(1, 10):
-            self.set_cell(i, Symbol.EMPTY)
+        self.cells.clear()
+        self.moves = 0
+        self.result = GameResult.NONE
+        self.history = 0
+
+    def to_tuple(self) -> tuple:
+        """Строка таблицы снимков (см. snapshots.SNAPSHOT_COLUMNS)"""
+        cells = self.cells
+        return (
+            self.board_id, self.author_id, self.target_id,
+            self.author_name, self.target_name,
+            str(self.author_symbol), str(self.target_symbol),
+            cells.first, cells.second, cells.turn,
+            cells.geometry.size, cells.geometry.k,
+            self.next_step, self.moves, str(self.result), self.history,
+        )
+
+    @classmethod
+    def from_tuple(cls, data: tuple):
+        (board_id, author_id, target_id, author_name, target_name,
+         author_symbol, target_symbol, first, second, turn,
+         size, k, next_step, moves, result, history) = data
+        return cls(
+            board_id, author_id, target_id,
+            author_name, target_name,
+            Symbol(author_symbol), Symbol(target_symbol),
+            BitBoard(first, second, turn, get_geometry(size, k)),
+            next_step, moves, GameResult(result), history,
+        )
 
 
 class GameData:
 
     def __init__(self):
-        self.db = Database(DB_NAME)
-        self.users = dict()
-        self.boards = dict()
-
-    def update_user_score(self, user_id: int, score: Score):
-        if user_id in self.users.keys():
-            self.users[user_id].score = score
-        self.db.update_user_score(user_id, score.player, score.bot, score.draw)
+        # Хранилище пользователей, снимков и журнала выбирается STORAGE_BACKEND
+        # (см. storage.py)
+        self.db = open_storage()
+        self.writes = WriteBehind(self.db)
+        self.users = UserCache()
+        self.boards = BoardStore()
+        self.board_locks = BoardLocks()
+        self.snapshots = Snapshotter(self.boards, database=snapshot_database())
+        self.game_log = GameLog(database=game_log_database())
+        self.leaderboard = Leaderboard()
+
+    async def start(self) -> list[asyncio.Task]:
+        """
+        Загружает рейтинг до приёма обновлений, чтобы ни одно изменение
+        счёта не потерялось, продолжает выдачу id полей с сохранённой
+        границы и запускает фоновые задачи: вытеснение полей,
+        снимки, журнал партий, отложенную запись и обновление рейтинга
+        """
+        self.leaderboard.load(await self.db.leaderboard_rows())
+        await self.snapshots.seed_ids()
+        return [
+            asyncio.create_task(self.boards.run_sweeper()),
+            asyncio.create_task(self.snapshots.run()),
+            asyncio.create_task(self.game_log.run()),
+            asyncio.create_task(self.writes.run()),
+            asyncio.create_task(self.leaderboard.run(self.db)),
+            asyncio.create_task(self.log_stats()),
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "boards": self.boards.stats(),
+            "users": self.users.stats(),
+            "board_locks": self.board_locks.stats(),
+            "leaderboard": self.leaderboard.stats(),
+            "writes": self.writes.stats(),
+            "snapshots": self.snapshots.stats(),
+            "game_log": self.game_log.stats(),
+        }
 
-    def get_user(self, user_id: int)-> UserData:
-        if not self.has_user(user_id):
-            return None
-        
-        if user_id in self.users.keys():
-            return self.users[user_id]
+    async def log_stats(self, interval: float = STATS_LOG_INTERVAL):
+        """Периодически пишет статистику хранилищ в лог, как AIPool.run"""
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Game data stats: {self.stats()}")
+
+    async def close(self, tasks: list[asyncio.Task]):
+        """Останавливает фоновые задачи и сохраняет то, что не успели записать"""
+        for task in tasks:
+            task.cancel()
+        await self.snapshots.close()
+        await self.game_log.close()
+        await self.writes.close()
+        await self.db.close()
+        logger.info(f"Game data stats: {self.stats()}")
+
+    async def add_user_score(self, user_id: int, player: int = 0, bot: int = 0,
+                             enemy: int = 0, draw: int = 0):
+        """Прибавляет очки к счёту; в базу попадёт со следующей пачкой записей"""
+        user = await self.get_user(user_id)
+        if user is None:
+            return
+        user.score.player += player
+        user.score.bot += bot
+        user.score.enemy += enemy
+        user.score.draw += draw
+        self.writes.add_score(user_id, player, bot, enemy, draw)
+        if player:
+            self.leaderboard.add(user_id, player)
+
+    async def set_user_name(self, user_id: int, name: str):
+        """Запоминает имя игрока для таблицы рекордов, если оно изменилось"""
+        user = await self.get_user(user_id)
+        if user is not None and user.name != name:
+            user.name = name
+            self.writes.set_name(user_id, name)
+
+    async def get_user(self, user_id: int) -> Optional[UserData]:
+        """
+        Пользователь из кэша, а при промахе - из базы.
+        Отсутствие пользователя тоже кэшируется
+        """
+        user = self.users.lookup(user_id)
+        if user is MISS:
+            generation = self.users.generation
+            user = await self.load_user(user_id)
+            # Пока шло чтение, другой процесс мог изменить пользователя
+            if self.users.generation == generation:
+                self.users.put(user_id, user)
+        return user
 
-        user = UserData.from_tuple(
-            self.db.get_user_by_chat_id(user_id)
-        )
-        raw_score = self.db.get_user_score_by_user_id(user_id)
-        if raw_score:
-            user.score = Score.from_tuple(
-                raw_score
-          
-        )
-        self.users[user_id] = user
+    async def load_user(self, user_id: int) -> Optional[UserData]:
+        """
+        Пользователь из базы с наложенными незаписанными изменениями
+        """
+        while True:
+            applied, raw_user, raw_score = await self.db.load_user(user_id)
+            changes = self.writes.changes_after(user_id, applied)
+            if changes is not None:
+                break
+
+        if raw_user is None:
+            if not any(change.is_new for change in changes):
+                return None
+            user = UserData(user_id)
+        else:
+            user = UserData.from_tuple(raw_user)
+            if raw_score:
+                user.score = Score.from_tuple(raw_score)
+        for change in changes:
+            change.apply(user)
         return user
 
-    def has_user(self, user_id: int):
-        if user_id in self.users.keys():
-            return self.users[user_id] != None
-        return self.db.get_user_by_chat_id(user_id) != None
+    async def has_user(self, user_id: int) -> bool:
+        return await self.get_user(user_id) is not None
 
-    def add_user(self, user_id: int):
-        self.db.add_user(user_id)
+    async def add_user(self, user_id: int) -> UserData:
         user = UserData(user_id)
-        self.users[user_id] = user
+        self.users.put(user_id, user)
+        self.writes.add_user(user_id)
+        return user
+
+    async def get_or_create_user(self, user_id: int) -> UserData:
+        user = await self.get_user(user_id)
+        if user is None:
+            user = await self.add_user(user_id)
         return user
 
-    def change_user_language(self, user_id: int, language: Language):
-        if user_id in self.users.keys():
-            self.users[user_id].language = language
-        self.db.change_user_language(user_id, language)
-    
-    def change_user_difficulty(self, user_id: int, difficulty: Difficulty):
-        if user_id in self.users.keys():
-            self.users[user_id].difficulty = difficulty
-        self.db.change_user_difficulty(user_id, difficulty)
+    async def change_user_language(self, user_id: int, language: Language):
+        user = self.users.lookup(user_id)
+        if user is not MISS and user is not None:
+            user.language = language
+        self.writes.set_language(user_id, language)
+
+    async def change_user_difficulty(self, user_id: int, difficulty: Difficulty):
+        user = self.users.lookup(user_id)
+        if user is not MISS and user is not None:
+            user.difficulty = difficulty
+        self.writes.set_difficulty(user_id, difficulty)
 
     def add_board(self,
             author_id: int, target_id: int,
             author_name: str, target_name: str,
             author_symbol, target_symbol) -> Board:
-        board_id = len(self.boards.keys()) + 1
+        board_id = self.boards.new_id()
         board = Board.create(
             board_id, author_id,
             target_id, author_name,
             target_name, author_symbol,
             target_symbol
         )
-        self.boards[board_id] = board
+        self.boards.add(board_id, board)
         return board
 
-    def get_board(self, board_id: int) -> Board:
-        if not board_id in self.boards.keys():
+    def get_board(self, board_id: int) -> Optional[Board]:
+        return self.boards.get(board_id)
+
+    async def load_board(self, board_id: int) -> Optional[Board]:
+        """
+        Поле из памяти, а если его там нет - из снимка.
+        Так партии продолжаются после перезапуска бота
+        """
+        board = self.boards.get(board_id)
+        if board is not None or board_id in self.boards.deleted:
+            return board
+        row = await self.snapshots.load(board_id)
+        # Пока шло чтение, поле могли восстановить или удалить
+        if row is None or board_id in self.boards.deleted:
             return None
-        return self.boards[board_id]
+        if board_id not in self.boards:
+            self.boards.restore(board_id, Board.from_tuple(row))
+        return self.boards.get(board_id)
+
+    def remove_board(self, board_id: int):
+        self.boards.remove(board_id)
+
+    async def finish_game(self, board: Board, difficulty: Optional[str] = None):
+        """Записывает законченную партию в журнал и обновляет счёт игроков"""
+        self.game_log.record(board, difficulty if board.target_id == 0 else None)
+        if board.result == GameResult.DRAW:
+            await self.add_user_score(board.author_id, draw=1)
+            if board.target_id != 0:
+                await self.add_user_score(board.target_id, draw=1)
+        elif board.target_id == 0:
+            if board.result == GameResult.AUTHOR:
+                await self.add_user_score(board.author_id, player=1)
+            else:
+                await self.add_user_score(board.author_id, bot=1)
+        else:
+            winner, loser = board.author_id, board.target_id
+            if board.result == GameResult.TARGET:
+                winner, loser = loser, winner
+            await self.add_user_score(winner, player=1)
+            await self.add_user_score(loser, enemy=1)
 
-    def init_game(self,
+    async def init_game(self,
             author_id: int, target_id: int,
             author_name: str, target_name: str,
             author_symbol, target_symbol) -> Board: 
@@ -276,14 +488,12 @@ class GameData:
            Проводит инициализацию игрового поля и параметров игроков. 
            Если target_id=0 создает одиночную игру
         """
-        author = self.get_user(author_id)
-        if author is None:
-            author = self.add_user(author_id)
+        author = await self.get_or_create_user(author_id)
+        await self.set_user_name(author_id, author_name)
 
         if target_id != 0:
-            target = self.get_user(target_id)
-            if target is None:
-                target = self.add_user(target_id)
+            target = await self.get_or_create_user(target_id)
+            await self.set_user_name(target_id, target_name)
             author.target_id = target.user_id
             target.target_id = author.user_id
 
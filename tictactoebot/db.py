@@ -1,62 +1,69 @@
+import asyncio
 import logging
 import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
+from .config import SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, DB_READERS
 from .enums import Language, Difficulty
+from .migrations import migrate
+from .storage import Storage
 
 
 DB_NAME = "gamedata.db"
 logger = logging.getLogger(__name__)
 
+# Базы, для которых в этом процессе уже созданы таблицы
+_schema_ready: set[str] = set()
+_schema_lock = threading.Lock()
+
+
+def connect(db_name: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Соединение с журналом WAL: читатели видят последнее зафиксированное
+    состояние и не ждут, пока писатель закончит транзакцию
+    """
+    conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    # Отрицательное значение - размер в килобайтах, а не в страницах
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 # TODO: Добавить дополнительные параметры в таблицу User
 
 class Database:
-    def __init__(self, db_name: str = DB_NAME):
+    def __init__(self, db_name: str = DB_NAME, check_same_thread: bool = True,
+                 migrate: bool = True):
         self.db_name = db_name
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+        self.check_same_thread = check_same_thread
+        self.migrate = migrate
+        self.open()
 
     def __enter__(self) -> "Database":
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+        self.open()
         return self
 
+    def open(self) -> None:
+        self.conn = connect(self.db_name, self.check_same_thread)
+        self.cursor = self.conn.cursor()
+        if not self.migrate:
+            return
+        with _schema_lock:
+            if self.db_name not in _schema_ready:
+                self.create_tables()
+                _schema_ready.add(self.db_name)
+
     def __exit__(self, exc_type, exc_value, traceback):
         self.conn.close()
 
     def create_tables(self) -> None:
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS User (
-                id INTEGER PRIMARY KEY,
-                chat_id INTEGER,
-                language TEXT DEFAULT 'en',
-                difficulty TEXT DEFAULT 'easy',
-                scores INTEGER DEFAULT 0,
-                FOREIGN KEY(scores) REFERENCES Score(id)
-            )
-            """
-        )
-        self.cursor.execute(
-            """
-            CREATE INDEX IF NOT EXISTS idx_chat_id ON User(chat_id)
-            """
-        )
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS Score (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER,
-                player INTEGER DEFAULT 0,
-                bot INTEGER DEFAULT 0,
-                enemy INTEGER DEFAULT 0,
-                draw INTEGER DEFAULT 0,
-                FOREIGN KEY(user_id) REFERENCES User(id)
-            )
-            """
-        )
-        self.conn.commit()
+        """Приводит схему к последней версии (см. migrations.py)"""
+        migrate(self.conn)
 
     def add_user(
         self,
@@ -64,10 +71,10 @@ class Database:
         language: Language = Language.ENGLISH,
         difficulty: Difficulty = Difficulty.EASY
     ) -> None:
-        self.cursor.execute('INSERT INTO User (chat_id, language, difficulty) VALUES (?, ?, ?)', (chat_id, language, difficulty))
+        self.cursor.execute('INSERT OR IGNORE INTO User (chat_id, language, difficulty) VALUES (?, ?, ?)', (chat_id, language, difficulty))
         
         # Добавление score для добавленного пользователя
-        self.cursor.execute('INSERT INTO Score (user_id, player, bot, enemy, draw) VALUES (?, 0, 0, 0, 0)', (chat_id,))
+        self.cursor.execute('INSERT OR IGNORE INTO Score (user_id, player, bot, enemy, draw) VALUES (?, 0, 0, 0, 0)', (chat_id,))
         
         self.conn.commit()
 
@@ -101,6 +108,38 @@ class Database:
         logger.info(f"Changed user:{chat_id} difficulty to {new_difficulty}")
         self.conn.commit()
 
+    def get_user_with_score(self, chat_id: int, writer: str = "") -> tuple:
+        """
+        Пользователь и его счёт одним запросом.
+        Возвращает (seq, строка User, строка Score), где seq - номер последней
+        пачки writer, видимой в том же снимке базы.
+        Запрос возвращает строку и для неизвестного chat_id, чтобы seq
+        читался тем же оператором, что и пользователь
+        """
+        self.cursor.execute(
+            """
+            SELECT
+                (SELECT seq FROM WriteSeq WHERE writer = ?),
+                User.id, User.chat_id, User.language, User.difficulty, User.scores, User.name,
+                Score.id, Score.user_id, Score.player, Score.bot, Score.enemy, Score.draw
+            FROM (SELECT 1)
+            LEFT JOIN User ON User.chat_id = ?
+            LEFT JOIN Score ON Score.user_id = User.chat_id
+            """,
+            (writer, chat_id),
+        )
+        row = self.cursor.fetchone()
+        if row[1] is None:
+            return row[0] or 0, None, None
+        logger.info(f"Get user:{chat_id} data with score from db")
+        score = row[7:] if row[7] is not None else None
+        return row[0] or 0, row[1:7], score
+
+    def get_leaderboard_rows(self) -> list[tuple[int, int]]:
+        """(chat_id, победы) всех игроков, у которых есть победы"""
+        self.cursor.execute("SELECT user_id, player FROM Score WHERE player > 0")
+        return self.cursor.fetchall()
+
     def get_user_score_by_id(self, id: int):
         self.cursor.execute("SELECT * FROM Score WHERE id = ?", (id,))
         result = self.cursor.fetchone()
@@ -127,3 +166,122 @@ class Database:
         )
         logger.info(f"Updated user:{user_id} scores")
         self.conn.commit()
+
+    def write_batch(self, rows: list[tuple], seq: int = 0, writer: str = "") -> None:
+        """
+        Изменения нескольких пользователей одной транзакцией.
+        Строка: (chat_id, is_new, language, difficulty, player, bot, enemy, draw, name),
+        language, difficulty и name - None, если не менялись, счёт - приращения.
+        В той же транзакции запоминается номер пачки seq для writer
+        """
+        new_users = [row for row in rows if row[1]]
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO User (chat_id, language, difficulty) VALUES (?, ?, ?)",
+            ((chat_id, language or Language.ENGLISH, difficulty or Difficulty.EASY)
+             for chat_id, _, language, difficulty, *_ in new_users),
+        )
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO Score (user_id, player, bot, enemy, draw) VALUES (?, 0, 0, 0, 0)",
+            ((row[0],) for row in new_users),
+        )
+        # Новый пользователь мог уже быть в базе (его записал другой процесс),
+        # тогда INSERT OR IGNORE выше его настройки не поменял
+        self.cursor.executemany(
+            "UPDATE User SET language = ? WHERE chat_id = ?",
+            ((row[2], row[0]) for row in rows if row[2] is not None),
+        )
+        self.cursor.executemany(
+            "UPDATE User SET difficulty = ? WHERE chat_id = ?",
+            ((row[3], row[0]) for row in rows if row[3] is not None),
+        )
+        self.cursor.executemany(
+            "UPDATE User SET name = ? WHERE chat_id = ?",
+            ((row[8], row[0]) for row in rows if row[8] is not None),
+        )
+        self.cursor.executemany(
+            """
+            UPDATE Score
+            SET player = player + ?,
+                bot = bot + ?,
+                enemy = enemy + ?,
+                draw = draw + ?
+            WHERE user_id = ?
+            """,
+            ((*row[4:8], row[0]) for row in rows if any(row[4:8])),
+        )
+        if writer:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO WriteSeq (writer, seq) VALUES (?, ?)", (writer, seq)
+            )
+        self.conn.commit()
+        logger.info(f"Wrote {len(rows)} users ({len(new_users)} new) in one transaction")
+
+
+class AsyncDatabase(Storage):
+    """
+    Database в отдельных потоках: те же запросы, но в виде корутин,
+    чтобы ожидание диска не останавливало цикл событий.
+    Все записи идут через один поток строго в порядке отправки,
+    чтение пользователей - через readers потоков со своими соединениями,
+    поэтому чтение не стоит в очереди за записью
+    """
+
+    def __init__(self, db_name: str = DB_NAME, readers: int = DB_READERS):
+        self.db_name = db_name
+        self.db: Optional[Database] = None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self.read_executor = ThreadPoolExecutor(readers, thread_name_prefix="db-reader")
+        self.local = threading.local()
+        self.readers: list[Database] = []
+        # Номера пачек write_batch хранятся в базе отдельно для каждого процесса
+        self.writer_id = uuid.uuid4().hex
+
+    def _run(self, method: str, *args):
+        if self.db is None:
+            self.db = Database(self.db_name)
+        return getattr(self.db, method)(*args)
+
+    def _read(self, method: str, *args):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = Database(self.db_name, check_same_thread=False)
+            self.readers.append(db)
+        return getattr(db, method)(*args)
+
+    def submit(self, method: str, *args) -> asyncio.Future:
+        """Отправляет запись сразу, не дожидаясь следующего шага цикла событий"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, self._run, method, *args)
+
+    async def read(self, method: str, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.read_executor, self._read, method, *args)
+
+    async def load_user(self, chat_id: int) -> tuple:
+        """
+        (номер последней записанной пачки, строка User, строка Score)
+        из одного снимка базы
+        """
+        return await self.read("get_user_with_score", chat_id, self.writer_id)
+
+    async def leaderboard_rows(self) -> list[tuple[int, int]]:
+        return await self.read("get_leaderboard_rows")
+
+    def submit_batch(self, rows: list[tuple], seq: int) -> asyncio.Future:
+        return self.submit("write_batch", rows, seq, self.writer_id)
+
+    def _close(self):
+        if self.db is not None:
+            self.db.cursor.execute("DELETE FROM WriteSeq WHERE writer = ?", (self.writer_id,))
+            self.db.conn.commit()
+            self.db.conn.close()
+            self.db = None
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close)
+        self.executor.shutdown()
+        self.read_executor.shutdown()
+        for db in self.readers:
+            db.conn.close()
+        self.readers.clear()
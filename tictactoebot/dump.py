@@ -0,0 +1,285 @@
+"""
+Выгрузка и загрузка пользователей и их счёта в формате NDJSON.
+
+Одна строка - один пользователь вместе со счётом:
+    {"chat_id": 1, "language": "en", "difficulty": "easy", "name": "Alice",
+     "player": 3, "bot": 1, "enemy": 0, "draw": 2}
+
+Выгрузка читает один запрос курсором по индексу chat_id, поэтому
+память не растёт с числом пользователей. Загрузка пишет пачками
+по --batch-size строк, каждая пачка - одна транзакция, в которой
+вместе с данными сохраняется номер последней записанной строки файла.
+Прерванная загрузка при повторном запуске продолжает с этой строки,
+если файл не менялся: контрольная точка привязана к полному пути,
+размеру и времени изменения файла. После полной загрузки она удаляется,
+и повторный запуск загружает файл заново. Загрузка из stdin
+контрольных точек не сохраняет, если не задан --checkpoint.
+Загрузка перезаписывает настройки и счёт существующих пользователей,
+поэтому повтор пачки безопасен. Бот на это время лучше остановить:
+его кэш пользователей не узнает об изменениях в базе.
+
+    python -m tictactoebot.dump export users.ndjson.gz
+    python -m tictactoebot.dump import users.ndjson.gz
+    python -m tictactoebot.dump generate --count 10000000 users.ndjson.gz
+    python -m tictactoebot.dump seed --count 10000000
+
+generate и seed создают правдоподобный набор пользователей для нагрузочных
+тестов; seed пишет его сразу в базу, без промежуточного файла.
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import IO, Iterable, Iterator, Optional
+
+from .db import DB_NAME, connect
+from .enums import Difficulty, Language
+from .migrations import migrate
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50_000
+FIELDS = ("chat_id", "language", "difficulty", "name", "player", "bot", "enemy", "draw")
+
+# Доли языков и сложностей в сгенерированных данных
+LANGUAGE_WEIGHTS = {
+    Language.ENGLISH: 40, Language.RUSSIAN: 25, Language.SPANISH: 12,
+    Language.PORTUGUESE: 10, Language.HINDI: 8, Language.INDONESIAN: 5,
+}
+DIFFICULTY_WEIGHTS = {Difficulty.EASY: 55, Difficulty.MEDIUM: 30, Difficulty.HARD: 15}
+MAX_GAMES = 5000
+
+
+def open_file(path: str, mode: str) -> IO[str]:
+    """Файл NDJSON; .gz сжимается на лету, "-" - stdin или stdout"""
+    if path == "-":
+        stream = sys.stdin if "r" in mode else sys.stdout
+        return open(stream.fileno(), mode, encoding="utf-8", closefd=False)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=1)
+    return open(path, mode, encoding="utf-8", buffering=io.DEFAULT_BUFFER_SIZE * 16)
+
+
+def iter_users(conn: sqlite3.Connection, after: int = 0) -> Iterator[tuple]:
+    """Пользователи со счётом по возрастанию chat_id, начиная после after"""
+    cursor = conn.execute(
+        """
+        SELECT
+            User.chat_id, User.language, User.difficulty, User.name,
+            COALESCE(Score.player, 0), COALESCE(Score.bot, 0),
+            COALESCE(Score.enemy, 0), COALESCE(Score.draw, 0)
+        FROM User
+        LEFT JOIN Score ON Score.user_id = User.chat_id
+        WHERE User.chat_id > ?
+        ORDER BY User.chat_id
+        """,
+        (after,),
+    )
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_users(conn: sqlite3.Connection, out: IO[str], after: int = 0) -> int:
+    count = 0
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for row in iter_users(conn, after):
+        out.write(dumps(dict(zip(FIELDS, row))))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def parse_line(line: str, number: int) -> tuple:
+    try:
+        data = json.loads(line)
+        return (
+            int(data["chat_id"]),
+            str(data.get("language") or Language.ENGLISH),
+            str(data.get("difficulty") or Difficulty.EASY),
+            data.get("name"),
+            int(data.get("player", 0)), int(data.get("bot", 0)),
+            int(data.get("enemy", 0)), int(data.get("draw", 0)),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"line {number}: {e!r}") from e
+
+
+def checkpoint_key(path: str) -> Optional[str]:
+    """Имя контрольной точки файла; другой файл по тому же пути получит другое имя"""
+    if path == "-":
+        return None
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def get_checkpoint(conn: sqlite3.Connection, source: str) -> int:
+    row = conn.execute(
+        "SELECT line FROM ImportCheckpoint WHERE source = ?", (source,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def write_users(conn: sqlite3.Connection, rows: list[tuple],
+                source: Optional[str] = None, line: int = 0) -> None:
+    """Одна транзакция: пользователи, их счёт и номер строки для source"""
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO User (chat_id, language, difficulty, name) VALUES (?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                language = excluded.language,
+                difficulty = excluded.difficulty,
+                name = COALESCE(excluded.name, User.name)
+            """,
+            (row[:4] for row in rows),
+        )
+        conn.executemany(
+            """
+            INSERT INTO Score (user_id, player, bot, enemy, draw) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                player = excluded.player,
+                bot = excluded.bot,
+                enemy = excluded.enemy,
+                draw = excluded.draw
+            """,
+            ((row[0], *row[4:]) for row in rows),
+        )
+        if source is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO ImportCheckpoint (source, line) VALUES (?, ?)",
+                (source, line),
+            )
+
+
+def import_rows(conn: sqlite3.Connection, rows: Iterable[tuple],
+                batch_size: int = BATCH_SIZE) -> int:
+    """Записывает строки пачками без контрольных точек"""
+    batch: list[tuple] = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write_users(conn, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        write_users(conn, batch)
+        count += len(batch)
+    return count
+
+
+def import_users(conn: sqlite3.Connection, lines: Iterable[str], source: Optional[str],
+                 batch_size: int = BATCH_SIZE) -> int:
+    """
+    Загружает строки NDJSON, пропуская уже записанные для source,
+    и удаляет контрольную точку source после последней строки.
+    source - None: без контрольных точек.
+    Возвращает число записанных в этот раз пользователей
+    """
+    done = get_checkpoint(conn, source) if source is not None else 0
+    if done:
+        logger.info(f"Resuming {source} after line {done}")
+    batch: list[tuple] = []
+    count = 0
+    number = 0
+    for number, line in enumerate(lines, 1):
+        if number <= done or not line.strip():
+            continue
+        batch.append(parse_line(line, number))
+        if len(batch) >= batch_size:
+            write_users(conn, batch, source, number)
+            count += len(batch)
+            batch = []
+    if batch:
+        write_users(conn, batch, source, number)
+        count += len(batch)
+    if source is not None:
+        with conn:
+            conn.execute("DELETE FROM ImportCheckpoint WHERE source = ?", (source,))
+    return count
+
+
+def generate_users(count: int, seed: int = 0, first_chat_id: int = 5_000_000_000) -> Iterator[tuple]:
+    """
+    Пользователи с правдоподобным распределением: большинство сыграло
+    несколько партий, у немногих их сотни
+    """
+    rng = random.Random(seed)
+    languages = rng.choices(list(LANGUAGE_WEIGHTS), list(LANGUAGE_WEIGHTS.values()), k=1024)
+    difficulties = rng.choices(list(DIFFICULTY_WEIGHTS), list(DIFFICULTY_WEIGHTS.values()), k=1024)
+    for i in range(count):
+        games = min(int(rng.paretovariate(1.2)) - 1, MAX_GAMES)
+        player = rng.randint(0, games)
+        bot = rng.randint(0, games - player)
+        enemy = rng.randint(0, games - player - bot)
+        yield (
+            first_chat_id + i,
+            str(languages[i & 1023]), str(difficulties[(i * 7) & 1023]),
+            f"player{i}",
+            player, bot, enemy, games - player - bot - enemy,
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m tictactoebot.dump")
+    parser.add_argument("--db", default=DB_NAME)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write users and scores as NDJSON")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--after", type=int, default=0, help="start after this chat_id")
+    import_parser = subparsers.add_parser("import", help="load users and scores from NDJSON")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser.add_argument("--checkpoint", default=None,
+                               help="checkpoint name, the file path, size and mtime by default")
+    generate_parser = subparsers.add_parser("generate", help="write a synthetic NDJSON dataset")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--count", type=int, default=1_000_000)
+    generate_parser.add_argument("--seed", type=int, default=0)
+    seed_parser = subparsers.add_parser("seed", help="load a synthetic dataset into the database")
+    seed_parser.add_argument("--count", type=int, default=1_000_000)
+    seed_parser.add_argument("--seed", type=int, default=0)
+    seed_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "generate":
+        with open_file(args.path, "w") as out:
+            dumps = json.JSONEncoder(separators=(",", ":")).encode
+            for row in generate_users(args.count, args.seed):
+                out.write(dumps(dict(zip(FIELDS, row))))
+                out.write("\n")
+        logger.info(f"Generated {args.count} users in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    conn = connect(args.db)
+    migrate(conn)
+    if args.command == "export":
+        with open_file(args.path, "w") as out:
+            count = export_users(conn, out, args.after)
+        logger.info(f"Exported {count} users in {time.perf_counter() - started:.1f}s")
+    elif args.command == "import":
+        source = args.checkpoint or checkpoint_key(args.path)
+        with open_file(args.path, "r") as lines:
+            count = import_users(conn, lines, source, args.batch_size)
+        logger.info(f"Imported {count} users in {time.perf_counter() - started:.1f}s")
+    else:
+        count = import_rows(conn, generate_users(args.count, args.seed), args.batch_size)
+        logger.info(f"Seeded {count} users in {time.perf_counter() - started:.1f}s")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,4 +22,12 @@ class Language(StrEnum):
 
 class Difficulty(StrEnum):
     EASY = "easy"
-    HARD = "hard"
\ No newline at end of file
+    MEDIUM = "medium"
+    HARD = "hard"
+
+
+class GameResult(StrEnum):
+    NONE = "none"
+    AUTHOR = "author"
+    TARGET = "target"
+    DRAW = "draw"
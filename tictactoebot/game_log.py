@@ -0,0 +1,167 @@
+"""
+Журнал сыгранных партий.
+
+Ходы партии хранятся одним BLOB: номер ячейки минус один,
+по geometry.move_bits бит на ход (4 бита на поле 3x3),
+первый ход в младших битах. Партия 3x3 занимает не больше 5 байт.
+Записи копятся в памяти и пишутся в базу пакетами одной транзакцией
+в отдельном потоке: раз в GAME_LOG_FLUSH_INTERVAL секунд
+или когда набралось GAME_LOG_BATCH_SIZE партий.
+С хранилищем пользователей в памяти (STORAGE_BACKEND, см. storage.py)
+журнал не пишется: NullGameLogDatabase.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .bitboard import get_geometry
+from .config import GAME_LOG_BATCH_SIZE, GAME_LOG_FLUSH_INTERVAL
+from .db import DB_NAME, connect
+from .migrations import migrate
+
+
+logger = logging.getLogger(__name__)
+
+
+def encode_moves(history: int, moves: int, move_bits: int) -> bytes:
+    return history.to_bytes((moves * move_bits + 7) // 8, "little")
+
+
+def decode_moves(data: bytes, moves: int, size: int = 3) -> list[int]:
+    """Номера ячеек в порядке ходов"""
+    move_bits = get_geometry(size).move_bits
+    history = int.from_bytes(data, "little")
+    step_mask = (1 << move_bits) - 1
+    return [(history >> move_bits * i & step_mask) + 1 for i in range(moves)]
+
+
+class GameLogDatabase:
+    """
+    Таблица GameLog в базе пользователей, схема - в migrations.py.
+    Соединение используется только из потока GameLog
+    """
+
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+        self.conn = connect(self.db_name, check_same_thread=False)
+        migrate(self.conn)
+
+    def write(self, rows: list[tuple]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO GameLog (
+                    author_id, target_id, difficulty, size, k,
+                    result, move_count, moves, finished_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class NullGameLogDatabase:
+    """GameLogDatabase, которая отбрасывает партии: журнал без базы на диске"""
+
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+
+    def write(self, rows: list[tuple]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class GameLog:
+    """
+    Буфер законченных партий. record не обращается к базе,
+    запись идёт пакетами в потоке журнала
+    """
+
+    def __init__(self, db_name: str = DB_NAME,
+                 batch_size: int = GAME_LOG_BATCH_SIZE,
+                 interval: float = GAME_LOG_FLUSH_INTERVAL,
+                 database: Callable[[str], GameLogDatabase] = GameLogDatabase):
+        self.db_name = db_name
+        self.database = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.db: Optional[GameLogDatabase] = None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="game-log")
+        self.buffer: list[tuple] = []
+        self.flushing: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def get_db(self) -> GameLogDatabase:
+        if self.db is None:
+            self.db = self.database(self.db_name)
+        return self.db
+
+    def _write(self, rows: list[tuple]) -> None:
+        self.get_db().write(rows)
+
+    def record(self, board, difficulty: Optional[str] = None):
+        """Добавляет законченную партию в буфер"""
+        geometry = board.cells.geometry
+        self.buffer.append((
+            board.author_id, board.target_id, difficulty,
+            geometry.size, geometry.k, str(board.result), board.moves,
+            encode_moves(board.history, board.moves, geometry.move_bits),
+            int(time.time()),
+        ))
+        self.recorded += 1
+        if len(self.buffer) >= self.batch_size and self.flushing is None:
+            self.flushing = asyncio.get_running_loop().create_task(self.flush())
+            self.flushing.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Task):
+        self.flushing = None
+
+    async def flush(self) -> int:
+        if not self.buffer:
+            return 0
+        rows, self.buffer = self.buffer, []
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.shield(loop.run_in_executor(self.executor, self._write, rows))
+        except Exception:
+            logger.exception(f"Failed to write {len(rows)} games to the log")
+            self.buffer[:0] = rows
+            return 0
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.written += len(rows)
+        return len(rows)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def close(self):
+        if self.flushing is not None:
+            await self.flushing
+        await self.flush()
+        if self.db is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.db.close)
+            self.db = None
+        logger.info(f"Game log stats: {self.stats()}")
+        self.executor.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "buffered": len(self.buffer),
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
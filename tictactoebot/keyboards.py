@@ -75,6 +75,10 @@ def make_difficulty_kb(code):
                     text=get_translate(code)['difficulty.easy'],
                     callback_data=DifficultyFilter(level='easy').pack()
                 ),
+                InlineKeyboardButton(
+                    text=translate(code, 'difficulty.medium'),
+                    callback_data=DifficultyFilter(level='medium').pack()
+                ),
                 InlineKeyboardButton(
                     text=get_translate(code)['difficulty.hard'],
                     callback_data=DifficultyFilter(level='hard').pack()
@@ -166,14 +170,15 @@ def make_invite_kb(authorId, language):
 def make_board_keyboard(board, chat_id: int):
     """
     Cоздает пользовательскую клавиатуру.
-    Клавиатура состоит из сетки кнопок 3x3,
-    каждая из которых имеет индекс от 1 до 9.
+    Клавиатура состоит из сетки кнопок NxN (3x3 для классической игры),
+    каждая из которых имеет индекс от 1 до N*N.
     """
+    size = board.cells.geometry.size
     keyboard = list()
     index = 0
-    for row in range(3):
+    for row in range(size):
         line = list()
-        for column in range(3):
+        for column in range(size):
             index += 1
             text = board.get_cell(index)
             btn_filter = FieldFilter(
@@ -0,0 +1,152 @@
+"""
+Рейтинг игроков по числу побед (Score.player).
+
+Рейтинг хранится в памяти и обновляется при каждом изменении счёта,
+поэтому место игрока и лучшие игроки не требуют запросов к базе.
+Одинаковое число побед - одинаковое место. Игроки без побед
+в структурах не хранятся: они делят последнее место.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+
+from .config import LEADERBOARD_REFRESH_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """
+    wins[user_id] - победы игрока, buckets[победы] - игроки с таким числом побед,
+    levels - различные числа побед по возрастанию.
+    Дерево Фенвика по числу побед отвечает, сколько игроков
+    побед больше заданного, за O(log max_wins)
+    """
+
+    def __init__(self, refresh_seconds: float = LEADERBOARD_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.clear()
+
+    def clear(self):
+        self.wins: dict[int, int] = {}
+        self.buckets: dict[int, set[int]] = {}
+        self.levels: list[int] = []
+        self.tree = [0] * 64
+
+    def __len__(self) -> int:
+        return len(self.wins)
+
+    def _tree_add(self, wins: int, delta: int):
+        while wins < len(self.tree):
+            self.tree[wins] += delta
+            wins += wins & -wins
+
+    def _tree_prefix(self, wins: int) -> int:
+        """Число игроков, у которых от 1 до wins побед"""
+        wins = min(wins, len(self.tree) - 1)
+        total = 0
+        while wins > 0:
+            total += self.tree[wins]
+            wins -= wins & -wins
+        return total
+
+    def _grow(self, wins: int):
+        """Увеличивает дерево под wins и заполняет его заново из buckets"""
+        size = len(self.tree)
+        while size <= wins:
+            size *= 2
+        self.tree = [0] * size
+        for level in self.levels:
+            count = len(self.buckets[level])
+            index = level
+            while index < size:
+                self.tree[index] += count
+                index += index & -index
+
+    def set(self, user_id: int, wins: int):
+        old = self.wins.get(user_id, 0)
+        if old == wins:
+            return
+        # Дерево растёт до изменения buckets: _grow переносит в новое дерево
+        # только то, что уже посчитано в старом
+        if wins >= len(self.tree):
+            self._grow(wins)
+        if old > 0:
+            bucket = self.buckets[old]
+            bucket.discard(user_id)
+            if not bucket:
+                del self.buckets[old]
+                del self.levels[bisect_left(self.levels, old)]
+            self._tree_add(old, -1)
+        if wins > 0:
+            self.wins[user_id] = wins
+            bucket = self.buckets.get(wins)
+            if bucket is None:
+                bucket = self.buckets[wins] = set()
+                insort(self.levels, wins)
+            bucket.add(user_id)
+            self._tree_add(wins, 1)
+        else:
+            self.wins.pop(user_id, None)
+
+    def add(self, user_id: int, delta: int):
+        self.set(user_id, self.wins.get(user_id, 0) + delta)
+
+    def rank(self, user_id: int) -> tuple[int, int]:
+        """(место, победы) игрока"""
+        wins = self.wins.get(user_id, 0)
+        above = len(self.wins) - self._tree_prefix(wins)
+        return above + 1, wins
+
+    def top(self, count: int = 10) -> list[tuple[int, int, int]]:
+        """
+        Лучшие игроки: (место, user_id, победы).
+        Из каждого числа побед берётся не больше нужного числа игроков,
+        место - из дерева, поэтому время не зависит от размера рейтинга.
+        Игроки с одинаковым числом побед идут в произвольном порядке
+        """
+        result = []
+        for wins in reversed(self.levels):
+            if len(result) >= count:
+                break
+            place = len(self.wins) - self._tree_prefix(wins) + 1
+            for user_id in islice(self.buckets[wins], count - len(result)):
+                result.append((place, user_id, wins))
+        return result
+
+    def load(self, rows):
+        """Строит рейтинг из пар (user_id, победы)"""
+        self.clear()
+        started = time.perf_counter()
+        for user_id, wins in rows:
+            if wins > 0:
+                self.wins[user_id] = wins
+                self.buckets.setdefault(wins, set()).add(user_id)
+        self.levels = sorted(self.buckets)
+        self._grow(self.levels[-1] if self.levels else 0)
+        logger.info(
+            f"Loaded leaderboard: {len(self.wins)} players "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    async def run(self, db):
+        """
+        При нескольких процессах бота рейтинг каждого процесса
+        видит только свои изменения, поэтому раз в refresh_seconds
+        он перечитывается из базы
+        """
+        if self.refresh_seconds <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            self.load(await db.leaderboard_rows())
+
+    def stats(self) -> dict:
+        return {
+            "players": len(self.wins),
+            "levels": len(self.levels),
+            "max_wins": self.levels[-1] if self.levels else 0,
+        }
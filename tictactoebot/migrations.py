@@ -0,0 +1,169 @@
+"""
+Версионные миграции схемы базы пользователей.
+
+Применённые версии хранятся в таблице schema_version.
+При открытии базы migrate применяет по порядку все миграции
+с номером больше текущей версии, каждую в своей транзакции.
+Новая миграция добавляется в конец MIGRATIONS со следующим номером,
+уже выпущенные миграции не меняются.
+"""
+import logging
+import sqlite3
+import time
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# Версия 1 - схема, которая создавалась до появления миграций,
+# поэтому все её запросы с IF NOT EXISTS: существующие базы проходят её без изменений
+INITIAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS User (
+        id INTEGER PRIMARY KEY,
+        chat_id INTEGER,
+        language TEXT DEFAULT 'en',
+        difficulty TEXT DEFAULT 'easy',
+        scores INTEGER DEFAULT 0,
+        FOREIGN KEY(scores) REFERENCES Score(id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_chat_id ON User(chat_id)",
+    """
+    CREATE TABLE IF NOT EXISTS Score (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        player INTEGER DEFAULT 0,
+        bot INTEGER DEFAULT 0,
+        enemy INTEGER DEFAULT 0,
+        draw INTEGER DEFAULT 0,
+        FOREIGN KEY(user_id) REFERENCES User(id)
+    )
+    """,
+]
+
+# Один пользователь на chat_id и один счёт на пользователя.
+# Дубликаты, оставшиеся от повторной регистрации, удаляются: остаётся первая запись,
+# счёт всех дубликатов складывается в первую запись Score
+UNIQUE_USERS = [
+    "DELETE FROM User WHERE id NOT IN (SELECT MIN(id) FROM User GROUP BY chat_id)",
+    """
+    UPDATE Score SET
+        player = (SELECT SUM(player) FROM Score AS d WHERE d.user_id = Score.user_id),
+        bot = (SELECT SUM(bot) FROM Score AS d WHERE d.user_id = Score.user_id),
+        enemy = (SELECT SUM(enemy) FROM Score AS d WHERE d.user_id = Score.user_id),
+        draw = (SELECT SUM(draw) FROM Score AS d WHERE d.user_id = Score.user_id)
+    WHERE id IN (SELECT MIN(id) FROM Score GROUP BY user_id HAVING COUNT(*) > 1)
+    """,
+    "DELETE FROM Score WHERE id NOT IN (SELECT MIN(id) FROM Score GROUP BY user_id)",
+    "DROP INDEX IF EXISTS idx_chat_id",
+    "CREATE UNIQUE INDEX idx_user_chat_id ON User(chat_id)",
+    "CREATE UNIQUE INDEX idx_score_user_id ON Score(user_id)",
+]
+
+# Имя игрока для таблицы рекордов и индекс для её построения
+USER_NAMES = [
+    "ALTER TABLE User ADD COLUMN name TEXT",
+    "CREATE INDEX idx_score_player ON Score(player)",
+]
+
+# Журнал сыгранных партий (game_log.py). До этой миграции таблица
+# создавалась при открытии журнала, поэтому IF NOT EXISTS
+GAME_LOG = [
+    """
+    CREATE TABLE IF NOT EXISTS GameLog (
+        id INTEGER PRIMARY KEY,
+        author_id INTEGER,
+        target_id INTEGER,
+        difficulty TEXT,
+        size INTEGER,
+        k INTEGER,
+        result TEXT,
+        move_count INTEGER,
+        moves BLOB,
+        finished_at INTEGER
+    )
+    """,
+]
+
+# Номер последней записанной пачки каждого AsyncDatabase (см. write_behind.py).
+# Раньше таблица создавалась в версии 1, поэтому IF NOT EXISTS
+WRITE_SEQ = [
+    """
+    CREATE TABLE IF NOT EXISTS WriteSeq (
+        writer TEXT PRIMARY KEY,
+        seq INTEGER
+    )
+    """,
+]
+
+# Номер последней записанной строки прерванной загрузки (dump.py).
+# Раньше таблица создавалась при загрузке, поэтому IF NOT EXISTS
+IMPORT_CHECKPOINTS = [
+    """
+    CREATE TABLE IF NOT EXISTS ImportCheckpoint (
+        source TEXT PRIMARY KEY,
+        line INTEGER
+    )
+    """,
+]
+
+# (версия, описание, запросы)
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "initial schema", INITIAL_SCHEMA),
+    (2, "unique chat_id and Score.user_id index", UNIQUE_USERS),
+    (3, "user names and Score.player index", USER_NAMES),
+    (4, "game log", GAME_LOG),
+    (5, "write batch sequence numbers", WRITE_SEQ),
+    (6, "import checkpoints", IMPORT_CHECKPOINTS),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at INTEGER
+        )
+        """
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """
+    Применяет миграции до версии target (по умолчанию - последней).
+    Несколько процессов могут открыть базу одновременно:
+    версия перечитывается внутри транзакции с блокировкой записи
+    """
+    target = LATEST_VERSION if target is None else target
+    for version, description, statements in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            started = time.perf_counter()
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(time.time())),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(
+            f"Applied migration {version} ({description}) "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+    return get_version(conn)
@@ -0,0 +1,324 @@
+"""
+Снимки активных партий на диске, чтобы игры переживали перезапуск бота.
+
+Раз в SNAPSHOT_INTERVAL секунд изменённые с прошлого снимка поля
+записываются в таблицу BoardSnapshot, а удалённые и вытесненные - стираются.
+Запись идёт в отдельном потоке, цикл событий только собирает строки.
+При старте ничего не загружается: поле читается из снимка
+при первом нажатии на его кнопку (GameData.load_board).
+Вместе со снимком сохраняется граница выданных id полей (BoardIdWatermark),
+с которой BoardStore продолжает выдачу после перезапуска.
+Снимки полей, брошенных дольше BOARD_TTL_SECONDS назад (в том числе
+до перезапуска), стираются при старте и раз в BOARD_SWEEP_INTERVAL секунд.
+С хранилищем пользователей в памяти (STORAGE_BACKEND, см. storage.py)
+снимки тоже хранятся в памяти: MemorySnapshotDatabase.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from .board_store import BoardStore
+from .config import (
+    BOARD_SWEEP_INTERVAL, BOARD_TTL_SECONDS, SNAPSHOT_DB_NAME, SNAPSHOT_INTERVAL,
+)
+from .db import connect
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COLUMNS = (
+    "board_id", "author_id", "target_id", "author_name", "target_name",
+    "author_symbol", "target_symbol", "first", "second", "turn",
+    "size", "k", "next_step", "moves", "result", "history",
+)
+
+
+class SnapshotDatabase:
+    """
+    Таблица снимков. Соединение используется только из потока Snapshotter
+    """
+
+    def __init__(self, db_name: str = SNAPSHOT_DB_NAME):
+        self.db_name = db_name
+        self.conn = connect(self.db_name, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS BoardSnapshot (
+                board_id INTEGER PRIMARY KEY,
+                author_id INTEGER,
+                target_id INTEGER,
+                author_name TEXT,
+                target_name TEXT,
+                author_symbol TEXT,
+                target_symbol TEXT,
+                first INTEGER,
+                second INTEGER,
+                turn INTEGER,
+                size INTEGER,
+                k INTEGER,
+                next_step INTEGER,
+                moves INTEGER,
+                result TEXT,
+                history INTEGER DEFAULT 0,
+                updated_at INTEGER
+            )
+            """
+        )
+        # Снимки, сохранённые до появления записи ходов
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(BoardSnapshot)")}
+        if "history" not in columns:
+            self.conn.execute("ALTER TABLE BoardSnapshot ADD COLUMN history INTEGER DEFAULT 0")
+        # Старым снимкам отсчёт времени начинается с обновления
+        if "updated_at" not in columns:
+            self.conn.execute("ALTER TABLE BoardSnapshot ADD COLUMN updated_at INTEGER")
+            self.conn.execute("UPDATE BoardSnapshot SET updated_at = ?", (int(time.time()),))
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_snapshot_updated_at ON BoardSnapshot(updated_at)"
+        )
+        # Одна строка на все процессы бота: базу снимков они делят
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS BoardIdWatermark (
+                id INTEGER PRIMARY KEY,
+                last_id INTEGER
+            )
+            """
+        )
+        self.conn.commit()
+
+    def write(self, rows: list[tuple], deleted: Iterable[int], last_id: int = 0) -> None:
+        """
+        Сохраняет и удаляет снимки одной транзакцией,
+        в ней же поднимает границу выданных id до last_id
+        """
+        columns = ", ".join(SNAPSHOT_COLUMNS)
+        placeholders = ", ".join("?" * len(SNAPSHOT_COLUMNS))
+        updated_at = int(time.time())
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO BoardSnapshot ({columns}, updated_at) "
+                f"VALUES ({placeholders}, ?)",
+                ((*row, updated_at) for row in rows),
+            )
+            self.conn.executemany(
+                "DELETE FROM BoardSnapshot WHERE board_id = ?",
+                ((board_id,) for board_id in deleted),
+            )
+            if last_id:
+                self.conn.execute(
+                    """
+                    INSERT INTO BoardIdWatermark (id, last_id) VALUES (0, ?)
+                    ON CONFLICT(id) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)
+                    """,
+                    (last_id,),
+                )
+
+    def read(self, board_id: int) -> Optional[tuple]:
+        return self.conn.execute(
+            f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM BoardSnapshot WHERE board_id = ?",
+            (board_id,),
+        ).fetchone()
+
+    def last_board_id(self) -> int:
+        """Наибольший id, который уже мог попасть в чат"""
+        snapshot = self.conn.execute("SELECT MAX(board_id) FROM BoardSnapshot").fetchone()[0]
+        watermark = self.conn.execute(
+            "SELECT last_id FROM BoardIdWatermark WHERE id = 0"
+        ).fetchone()
+        return max(snapshot or 0, watermark[0] if watermark else 0)
+
+    def purge(self, older_than: float) -> int:
+        """Удаляет снимки, которые не обновлялись с момента older_than"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM BoardSnapshot WHERE updated_at < ?", (int(older_than),)
+            )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM BoardSnapshot").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class MemorySnapshotDatabase:
+    """
+    SnapshotDatabase в памяти процесса: поля переживают вытеснение,
+    но не перезапуск, и на диск ничего не пишется
+    """
+
+    def __init__(self, db_name: str = SNAPSHOT_DB_NAME):
+        self.db_name = db_name
+        # board_id -> (строка снимка, updated_at)
+        self.rows: dict[int, tuple[tuple, int]] = {}
+        self.watermark = 0
+
+    def write(self, rows: list[tuple], deleted: Iterable[int], last_id: int = 0) -> None:
+        updated_at = int(time.time())
+        for row in rows:
+            self.rows[row[0]] = (row, updated_at)
+        for board_id in deleted:
+            self.rows.pop(board_id, None)
+        self.watermark = max(self.watermark, last_id)
+
+    def read(self, board_id: int) -> Optional[tuple]:
+        saved = self.rows.get(board_id)
+        return saved[0] if saved is not None else None
+
+    def last_board_id(self) -> int:
+        return max(max(self.rows, default=0), self.watermark)
+
+    def purge(self, older_than: float) -> int:
+        stale = [board_id for board_id, (_, updated_at) in self.rows.items()
+                 if updated_at < int(older_than)]
+        for board_id in stale:
+            del self.rows[board_id]
+        return len(stale)
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def close(self) -> None:
+        pass
+
+
+class Snapshotter:
+    """
+    Периодически сохраняет изменения BoardStore в SnapshotDatabase.
+    Все обращения к базе идут через один поток, поэтому
+    запись и чтение снимков не пересекаются
+    """
+
+    def __init__(self, store: BoardStore, db_name: str = SNAPSHOT_DB_NAME,
+                 interval: float = SNAPSHOT_INTERVAL,
+                 ttl: float = BOARD_TTL_SECONDS,
+                 purge_interval: float = BOARD_SWEEP_INTERVAL,
+                 database: Callable[[str], SnapshotDatabase] = SnapshotDatabase):
+        self.store = store
+        self.db_name = db_name
+        self.database = database
+        self.interval = interval
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.db: Optional[SnapshotDatabase] = None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="snapshots")
+        self.snapshots = 0
+        self.saved = 0
+        self.deleted = 0
+        self.restored = 0
+        self.purged = 0
+        self.last_flush_ms = 0.0
+
+    def get_db(self) -> SnapshotDatabase:
+        """База открывается в потоке снимков при первом обращении"""
+        if self.db is None:
+            self.db = self.database(self.db_name)
+        return self.db
+
+    async def call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _write(self, rows: list[tuple], deleted: set[int], last_id: int) -> None:
+        self.get_db().write(rows, deleted, last_id)
+
+    def _last_board_id(self) -> int:
+        return self.get_db().last_board_id()
+
+    async def seed_ids(self):
+        """Продолжает выдачу id полей после выданных до перезапуска"""
+        self.store.seed_ids(await self.call(self._last_board_id))
+
+    def _read(self, board_id: int) -> Optional[tuple]:
+        return self.get_db().read(board_id)
+
+    def _purge(self, older_than: float) -> int:
+        return self.get_db().purge(older_than)
+
+    async def purge(self) -> int:
+        """
+        Стирает снимки полей, неактивных дольше ttl: в памяти такие поля
+        уже вытеснены, а брошенные до перезапуска иначе остались бы навсегда
+        """
+        try:
+            purged = await self.call(self._purge, time.time() - self.ttl)
+        except Exception:
+            logger.exception("Failed to purge stale board snapshots")
+            return 0
+        self.purged += purged
+        if purged:
+            logger.info(f"Purged {purged} stale board snapshots")
+        return purged
+
+    async def flush(self) -> int:
+        """
+        Записывает изменения с прошлого снимка.
+        Строки собираются в цикле событий, поэтому снимок каждого поля
+        согласован, даже если партия продолжается во время записи
+        """
+        boards, deleted = self.store.drain_changes()
+        if not boards and not deleted:
+            return 0
+        rows = [board.to_tuple() for board in boards]
+        started = time.perf_counter()
+        try:
+            # Остановка бота не должна терять уже собранные строки
+            await asyncio.shield(
+                self.call(self._write, rows, deleted, self.store.id_watermark())
+            )
+        except Exception:
+            # Изменения вернутся в следующий снимок
+            logger.exception("Failed to write board snapshot")
+            self.store.dirty.update(board.board_id for board in boards
+                                    if board.board_id in self.store)
+            return 0
+        self.store.deletes_written(deleted)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.snapshots += 1
+        self.saved += len(rows)
+        self.deleted += len(deleted)
+        return len(rows) + len(deleted)
+
+    async def load(self, board_id: int) -> Optional[tuple]:
+        """Строка снимка поля или None, если поле не сохранялось"""
+        row = await self.call(self._read, board_id)
+        if row is not None:
+            self.restored += 1
+        return row
+
+    async def run(self):
+        await self.purge()
+        next_purge = time.monotonic() + self.purge_interval
+        while True:
+            await asyncio.sleep(self.interval)
+            changed = await self.flush()
+            if changed:
+                logger.debug(f"Snapshot: {changed} boards in {self.last_flush_ms:.1f}ms")
+            if time.monotonic() >= next_purge:
+                await self.purge()
+                next_purge = time.monotonic() + self.purge_interval
+
+    async def close(self):
+        """Последний снимок перед остановкой бота"""
+        await self.flush()
+        if self.db is not None:
+            await self.call(self.db.close)
+            self.db = None
+        logger.info(f"Snapshot stats: {self.stats()}")
+        self.executor.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "snapshots": self.snapshots,
+            "saved": self.saved,
+            "deleted": self.deleted,
+            "restored": self.restored,
+            "purged": self.purged,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
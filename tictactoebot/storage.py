@@ -0,0 +1,245 @@
+"""
+Хранилище пользователей и счёта, которым пользуется GameData.
+
+Storage - всё, что GameData нужно от хранилища:
+чтение пользователя вместе со счётом, запись пачек отложенной записи
+(см. write_behind.py), строки рейтинга и закрытие.
+
+Реализации:
+    sqlite  - AsyncDatabase из db.py, файл DB_NAME;
+    memory  - MemoryStorage, словари в памяти процесса (тесты и бенчмарки);
+    localkv - KVStorage поверх LocalKV, заменителя сетевого хранилища
+              ключ-значение с задержкой STORAGE_KV_LATENCY_MS на запрос.
+
+Хранилище выбирается переменной окружения STORAGE_BACKEND. От неё же
+зависят базы снимков партий и журнала (snapshot_database, game_log_database):
+с sqlite это файлы SNAPSHOT_DB_NAME и DB_NAME, с остальными хранилищами
+снимки держатся в памяти, а журнал не пишется.
+Сетевое хранилище (например, Redis) подключается так же, как LocalKV:
+нужен клиент с методами KVClient, KVStorage от клиента не зависит.
+"""
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Optional
+
+from .config import STORAGE_BACKEND, STORAGE_KV_LATENCY_MS
+from .enums import Difficulty, Language
+
+
+class Storage(ABC):
+
+    @abstractmethod
+    async def load_user(self, chat_id: int) -> tuple:
+        """
+        (seq, строка User, строка Score) из одного снимка хранилища.
+        seq - номер последней записанной пачки этого хранилища,
+        строка User - (id, chat_id, language, difficulty, scores, name),
+        строка Score - (id, user_id, player, bot, enemy, draw).
+        Строки - None, если пользователя нет
+        """
+
+    @abstractmethod
+    def submit_batch(self, rows: list[tuple], seq: int) -> Awaitable:
+        """
+        Отправляет пачку сразу, в том же шаге цикла событий.
+        Пачки применяются в порядке отправки, каждая целиком.
+        Строка: (chat_id, is_new, language, difficulty, player, bot, enemy, draw, name),
+        language, difficulty и name - None, если не менялись, счёт - приращения
+        """
+
+    @abstractmethod
+    async def leaderboard_rows(self) -> list[tuple[int, int]]:
+        """(chat_id, победы) всех игроков, у которых есть победы"""
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+
+class KVClient(ABC):
+    """
+    Клиент хранилища ключ-значение, где значение - словарь полей
+    (hash в терминах Redis)
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        """Значения ключей из одного снимка; None для отсутствующих"""
+
+    @abstractmethod
+    async def write(self, defaults: dict[str, dict], sets: dict[str, dict],
+                    increments: dict[str, dict[str, int]]):
+        """
+        Одна атомарная запись: поля defaults задаются, только если их ещё нет,
+        поля sets перезаписываются, к полям increments прибавляются числа
+        """
+
+    @abstractmethod
+    async def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        """Все ключи с префиксом и их значения"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class LocalKV(KVClient):
+    """
+    KVClient в памяти процесса. latency_ms - задержка каждого запроса,
+    чтобы бенчмарки и тесты видели стоимость обращения по сети
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.data: dict[str, dict] = {}
+        self.requests = 0
+
+    async def _round_trip(self):
+        self.requests += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[dict]]:
+        await self._round_trip()
+        result = []
+        for key in keys:
+            value = self.data.get(key)
+            result.append(dict(value) if value is not None else None)
+        return result
+
+    async def write(self, defaults: dict[str, dict], sets: dict[str, dict],
+                    increments: dict[str, dict[str, int]]):
+        await self._round_trip()
+        for key, fields in defaults.items():
+            value = self.data.setdefault(key, {})
+            for name, field_value in fields.items():
+                value.setdefault(name, field_value)
+        for key, fields in sets.items():
+            self.data.setdefault(key, {}).update(fields)
+        for key, fields in increments.items():
+            value = self.data.setdefault(key, {})
+            for name, delta in fields.items():
+                value[name] = value.get(name, 0) + delta
+
+    async def scan(self, prefix: str) -> list[tuple[str, dict]]:
+        await self._round_trip()
+        return [
+            (key, dict(value)) for key, value in self.data.items()
+            if key.startswith(prefix)
+        ]
+
+    async def delete(self, key: str):
+        await self._round_trip()
+        self.data.pop(key, None)
+
+
+class KVStorage(Storage):
+    """
+    Storage поверх KVClient. Пользователь со счётом - один ключ
+    user:<chat_id>, номер последней пачки - ключ seq:<writer>,
+    который пишется той же атомарной записью, что и пачка
+    """
+    SCORE_FIELDS = ("player", "bot", "enemy", "draw")
+
+    def __init__(self, client: KVClient, writer: Optional[str] = None):
+        self.client = client
+        # Как и в AsyncDatabase, номера пачек у каждого процесса свои
+        self.seq_key = f"seq:{writer or uuid.uuid4().hex}"
+        # Задачи стартуют в порядке создания, замок отдаётся в порядке очереди,
+        # поэтому пачки уходят клиенту в порядке отправки
+        self.write_lock = asyncio.Lock()
+
+    async def load_user(self, chat_id: int) -> tuple:
+        seq, value = await self.client.get_many([self.seq_key, f"user:{chat_id}"])
+        applied = seq["seq"] if seq else 0
+        if value is None or "language" not in value:
+            return applied, None, None
+        user = (
+            chat_id, chat_id, value["language"], value["difficulty"],
+            chat_id, value.get("name"),
+        )
+        score = (chat_id, chat_id, *(value.get(name, 0) for name in self.SCORE_FIELDS))
+        return applied, user, score
+
+    def submit_batch(self, rows: list[tuple], seq: int) -> Awaitable:
+        return asyncio.get_running_loop().create_task(self._write_batch(rows, seq))
+
+    async def _write_batch(self, rows: list[tuple], seq: int):
+        defaults: dict[str, dict] = {}
+        sets: dict[str, dict] = {self.seq_key: {"seq": seq}}
+        increments: dict[str, dict[str, int]] = {}
+        for chat_id, is_new, language, difficulty, *score, name in rows:
+            key = f"user:{chat_id}"
+            if is_new:
+                defaults[key] = {
+                    "language": str(language or Language.ENGLISH),
+                    "difficulty": str(difficulty or Difficulty.EASY),
+                }
+            changed = {}
+            if language is not None:
+                changed["language"] = str(language)
+            if difficulty is not None:
+                changed["difficulty"] = str(difficulty)
+            if name is not None:
+                changed["name"] = name
+            if changed:
+                sets[key] = changed
+            if any(score):
+                increments[key] = dict(zip(self.SCORE_FIELDS, score))
+        async with self.write_lock:
+            await self.client.write(defaults, sets, increments)
+
+    async def leaderboard_rows(self) -> list[tuple[int, int]]:
+        return [
+            (int(key[len("user:"):]), value["player"])
+            for key, value in await self.client.scan("user:")
+            if value.get("player", 0) > 0
+        ]
+
+    async def close(self):
+        async with self.write_lock:
+            await self.client.delete(self.seq_key)
+        await self.client.close()
+
+
+class MemoryStorage(KVStorage):
+    """Хранилище в памяти процесса, без задержек; данные теряются при остановке"""
+
+    def __init__(self):
+        super().__init__(LocalKV())
+
+
+def open_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "sqlite":
+        # db.py сам импортирует Storage из этого модуля
+        from .db import AsyncDatabase, DB_NAME
+        return AsyncDatabase(DB_NAME)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "localkv":
+        return KVStorage(LocalKV(STORAGE_KV_LATENCY_MS))
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+def snapshot_database(backend: str = STORAGE_BACKEND):
+    """Класс базы снимков партий для хранилища backend"""
+    from .snapshots import MemorySnapshotDatabase, SnapshotDatabase
+    if backend == "sqlite":
+        return SnapshotDatabase
+    if backend in ("memory", "localkv"):
+        return MemorySnapshotDatabase
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+def game_log_database(backend: str = STORAGE_BACKEND):
+    """Класс базы журнала партий для хранилища backend"""
+    from .game_log import GameLogDatabase, NullGameLogDatabase
+    if backend == "sqlite":
+        return GameLogDatabase
+    if backend in ("memory", "localkv"):
+        return NullGameLogDatabase
+    raise ValueError(f"Unknown storage backend: {backend!r}")
@@ -0,0 +1,231 @@
+"""
+Таблица эндшпилей (tablebase) для поля N×N с k в ряд.
+
+Каждой расстановке соответствует индекс в троичной системе:
+цифра ячейки i (1..N*N) с весом 3 ** (i - 1) равна 0 для пустой ячейки,
+1 для символа первого игрока и 2 для символа второго.
+Ходящий игрок определяется числом символов на поле.
+
+Для каждой позиции хранится 2 бита - результат для ходящего игрока
+при идеальной игре обеих сторон (0 - позиция недостижима).
+Поле 4x4 занимает 3 ** 16 / 4 байт (~10.8 МБ), файл читается через mmap,
+поэтому все процессы бота используют одну копию из страничного кэша.
+
+Генерация:
+    python -m tictactoebot.tablebase generate --size 4 tablebase_4x4.bin
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Optional, Union
+
+from .bitboard import Geometry, cell_bit, get_geometry, iter_cells
+
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN, LOSS, DRAW, WIN = 0, 1, 2, 3
+
+MAGIC = b"TTTB"
+HEADER = struct.Struct("<4sBBBx")  # magic, version, size, k
+VERSION = 1
+
+ByteBuffer = Union[bytearray, mmap.mmap]
+
+
+def invert(value: int) -> int:
+    """Результат для соперника: победа <-> поражение, ничья остаётся ничьей"""
+    return 4 - value if value else UNKNOWN
+
+
+class PositionIndexer:
+    """
+    Переводит маски игроков в троичный индекс позиции.
+    Маска разбивается на байты, для каждого байта индекс берётся из таблицы.
+    """
+
+    def __init__(self, geometry: Geometry):
+        self.geometry = geometry
+        self.powers = (0,) + tuple(3 ** (i - 1) for i in geometry.cells)
+        self.chunks = []
+        for shift in range(0, len(geometry.cells), 8):
+            self.chunks.append((shift, tuple(
+                sum(3 ** (shift + bit) for bit in range(8) if byte >> bit & 1)
+                for byte in range(256)
+            )))
+        self.size = 3 ** len(geometry.cells)
+
+    def ternary(self, mask: int) -> int:
+        return sum(table[mask >> shift & 0xFF] for shift, table in self.chunks)
+
+    def index(self, first: int, second: int) -> int:
+        return self.ternary(first) + 2 * self.ternary(second)
+
+
+class Tablebase:
+    """
+    Упакованная таблица результатов: 4 позиции на байт
+    """
+
+    def __init__(self, geometry: Geometry, data: ByteBuffer, offset: int = 0):
+        self.geometry = geometry
+        self.indexer = PositionIndexer(geometry)
+        self.data = data
+        self.offset = offset
+
+    @classmethod
+    def empty(cls, geometry: Geometry) -> "Tablebase":
+        size = 3 ** len(geometry.cells)
+        return cls(geometry, bytearray((size + 3) // 4))
+
+    @classmethod
+    def open(cls, path: str) -> "Tablebase":
+        """Отображает файл в память только для чтения"""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, k = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        return cls(get_geometry(size, k), data, HEADER.size)
+
+    def save(self, path: str):
+        header = HEADER.pack(MAGIC, VERSION, self.geometry.size, self.geometry.k)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(self.data[self.offset:])
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def get(self, index: int) -> int:
+        byte = self.data[self.offset + (index >> 2)]
+        return byte >> ((index & 3) << 1) & 3
+
+    def set(self, index: int, value: int):
+        position = self.offset + (index >> 2)
+        shift = (index & 3) << 1
+        self.data[position] = self.data[position] & ~(3 << shift) | value << shift
+
+    def lookup(self, first: int, second: int) -> int:
+        """Результат позиции для ходящего игрока"""
+        return self.get(self.indexer.index(first, second))
+
+    def best_moves(self, first: int, second: int) -> tuple[int, list[int]]:
+        """
+        Возвращает результат позиции для ходящего игрока
+        и все ходы, которые его обеспечивают (по возрастанию индекса)
+        """
+        geometry = self.geometry
+        indexer = self.indexer
+        first_to_move = first.bit_count() == second.bit_count()
+        own = first if first_to_move else second
+        digit = 1 if first_to_move else 2
+        index = indexer.index(first, second)
+        empty = geometry.full_mask & ~(first | second)
+
+        results: dict[int, int] = {}
+        for i in iter_cells(empty):
+            if geometry.is_win_at(own | cell_bit(i), i):
+                results[i] = WIN
+            else:
+                results[i] = invert(self.get(index + digit * indexer.powers[i]))
+        if not results:
+            return UNKNOWN, []
+        best = max(results.values())
+        return best, [i for i, value in results.items() if value == best]
+
+
+def generate(geometry: Geometry) -> Tablebase:
+    """
+    Решает все позиции, достижимые из пустого поля.
+    Перебираются все ходы (без отсечений), чтобы в таблице оказалась
+    любая позиция, которую может получить игрок.
+    """
+    tablebase = Tablebase.empty(geometry)
+    powers = tablebase.indexer.powers
+    full_mask = geometry.full_mask
+    is_win_at = geometry.is_win_at
+    get, put = tablebase.get, tablebase.set
+    solved = 0
+
+    def solve(own: int, opponent: int, index: int, digit: int) -> int:
+        nonlocal solved
+        value = get(index)
+        if value:
+            return value
+        empty = full_mask & ~(own | opponent)
+        if not empty:
+            value = DRAW
+        else:
+            value = LOSS
+            for i in iter_cells(empty):
+                child_own = own | cell_bit(i)
+                child_index = index + digit * powers[i]
+                if is_win_at(child_own, i):
+                    if not get(child_index):
+                        put(child_index, LOSS)
+                    child = LOSS
+                else:
+                    child = solve(opponent, child_own, child_index, 3 - digit)
+                if 4 - child > value:
+                    value = 4 - child
+        put(index, value)
+        solved += 1
+        if solved % 1_000_000 == 0:
+            logger.info(f"Solved {solved} positions")
+        return value
+
+    solve(0, 0, 0, 1)
+    logger.info(f"Solved {solved} positions of {geometry}")
+    return tablebase
+
+
+def verify_classic(tablebase: Tablebase) -> int:
+    """Сверяет таблицу 3x3 с таблицей ходов MiniMaxAI"""
+    from .ai import get_move_table
+
+    checked = 0
+    for (own, opponent), (score, moves) in get_move_table().items():
+        first_to_move = own.bit_count() == opponent.bit_count()
+        first, second = (own, opponent) if first_to_move else (opponent, own)
+        value, best_moves = tablebase.best_moves(first, second)
+        assert value == score + 2, (own, opponent, value, score)
+        assert best_moves == list(moves), (own, opponent, best_moves, moves)
+        checked += 1
+    return checked
+
+
+def main(argv: Optional[list[str]] = None):
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m tictactoebot.tablebase")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="solve and write a tablebase file")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--size", type=int, default=4)
+    generate_parser.add_argument("--k", type=int, default=None)
+    verify_parser = subparsers.add_parser("verify", help="check a 3x3 tablebase against MiniMaxAI")
+    verify_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), args.size * args.size + 100))
+        started = time.perf_counter()
+        tablebase = generate(get_geometry(args.size, args.k))
+        tablebase.save(args.path)
+        logger.info(f"Wrote {args.path} in {time.perf_counter() - started:.1f}s")
+    else:
+        tablebase = Tablebase.open(args.path)
+        logger.info(f"Verified {verify_classic(tablebase)} positions")
+        tablebase.close()
+
+
+if __name__ == "__main__":
+    main()
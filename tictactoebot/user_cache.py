@@ -0,0 +1,99 @@
+"""
+Кэш пользователей с вытеснением давно не использованных записей.
+"""
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from .clock import monotonic
+from .config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS
+
+
+# Возвращается lookup, если о пользователе ничего не известно
+MISS = object()
+
+
+class UserCache:
+    """
+    Пользователи в порядке последнего обращения (LRU).
+    Кэшируется и отсутствие пользователя (значение None),
+    чтобы повторные запросы незнакомых id не доходили до базы.
+    Запись устаревает через ttl секунд после загрузки,
+    отрицательная - через negative_ttl.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE,
+                 ttl: float = USER_CACHE_TTL_SECONDS,
+                 negative_ttl: float = USER_CACHE_NEGATIVE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # user_id -> (UserData или None, время загрузки)
+        self.entries: OrderedDict[int, tuple[Optional[object], float]] = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+        # Растёт при каждом invalidate: чтение, начатое до него, не кэшируется
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def lookup(self, user_id: int):
+        """Пользователь, None, если известно, что его нет, или MISS"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return MISS
+        user, loaded_at = entry
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if monotonic() - loaded_at >= ttl:
+            del self.entries[user_id]
+            self.expired += 1
+            self.misses += 1
+            return MISS
+        self.entries.move_to_end(user_id)
+        if user is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return user
+
+    def put(self, user_id: int, user):
+        self.entries[user_id] = (user, monotonic())
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def remove(self, user_id: int):
+        self.entries.pop(user_id, None)
+
+    def invalidate(self, user_ids: Iterable[int]):
+        """Забывает пользователей, которых изменил другой процесс бота"""
+        for user_id in user_ids:
+            if self.entries.pop(user_id, None) is not None:
+                self.invalidated += 1
+        self.generation += 1
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio(), 4),
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+        }
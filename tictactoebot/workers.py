@@ -0,0 +1,200 @@
+"""
+Запуск бота в нескольких процессах.
+
+Обновления от Телеграма получает один процесс и раздаёт их воркерам:
+нажатия на поле - процессу, которому принадлежит поле (shard_of от board_id),
+остальные обновления - процессу пользователя. Поле создаётся с id,
+принадлежащим создавшему его процессу, поэтому каждую партию
+ведёт ровно один процесс. Общее состояние - база пользователей
+и снимки партий, которые процессы читают из общих файлов SQLite.
+
+Пользователь кэшируется в каждом процессе, который с ним работал:
+настройки меняет процесс пользователя, а счёт - процесс поля.
+Поэтому после фиксации каждой пачки отложенной записи процесс
+рассылает остальным chat_id из неё, и те забывают этих пользователей.
+Другой процесс видит изменение не позже чем через WRITE_BEHIND_INTERVAL_MS
+и доставку сообщения. Хранилище пользователей должно быть общим (sqlite).
+
+    BOT_WORKERS=4 python tictactoebot.py
+"""
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+import os
+import signal
+from queue import Empty
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+from .board_store import shard_of
+from .config import BOT_TOKEN, LOGGING_CONFIG, STORAGE_BACKEND
+from .filters import FieldFilter
+
+
+logger = logging.getLogger(__name__)
+
+# Столько обновлений может ждать воркера, дальше приём обновлений притормаживает
+QUEUE_SIZE = 10_000
+
+
+def route_key(update: Update) -> int:
+    """id, по которому выбирается воркер для обновления"""
+    query = update.callback_query
+    if query is not None:
+        if query.data and query.data.startswith(FieldFilter.__prefix__ + ":"):
+            try:
+                return FieldFilter.unpack(query.data).board_id
+            except (TypeError, ValueError):
+                pass
+        return query.from_user.id
+    for event in (update.message, update.inline_query, update.edited_message):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return 0
+
+
+def worker_of(update: Update, workers: int) -> int:
+    """Номер воркера, который обрабатывает обновление"""
+    return shard_of(route_key(update), workers)
+
+
+def worker_main(index: int, queue: multiprocessing.Queue,
+                invalidations: list[multiprocessing.Queue]):
+    """Точка входа процесса-воркера"""
+    # Ctrl+C получает весь процесс; воркеры останавливает главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.config.dictConfig(LOGGING_CONFIG)
+    asyncio.run(run_worker(index, queue, invalidations))
+
+
+async def receive_invalidations(inbox: multiprocessing.Queue, users):
+    """Забывает пользователей, которых записали другие воркеры"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            # С таймаутом, чтобы поток не держал остановку воркера
+            user_ids = await loop.run_in_executor(None, inbox.get, True, 1.0)
+        except Empty:
+            continue
+        users.invalidate(user_ids)
+
+
+async def run_worker(index: int, queue: multiprocessing.Queue,
+                     invalidations: list[multiprocessing.Queue],
+                     session: Optional[BaseSession] = None):
+    """
+    Обрабатывает обновления из queue до None.
+    session - сессия Bot API (по умолчанию - сеть), бенчмарк подставляет свою
+    """
+    from aiogram import Dispatcher
+
+    from .ai_pool import AI_POOL
+    from .callback_queries import router as CallbackQueriesRouter
+    from .commands import router as CommandsRouter
+    from .data import DATA_GAME
+    from .inline_queries import router as InlineQueriesRouter
+
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = Dispatcher()
+    dp.include_router(InlineQueriesRouter)
+    dp.include_router(CallbackQueriesRouter)
+    dp.include_router(CommandsRouter)
+
+    peers = [peer for i, peer in enumerate(invalidations) if i != index]
+    for peer in peers:
+        # Остановившийся соседний воркер не должен задерживать выход
+        peer.cancel_join_thread()
+
+    def broadcast(user_ids: list[int]):
+        for peer in peers:
+            peer.put(user_ids)
+
+    DATA_GAME.writes.on_written = broadcast
+
+    loop = asyncio.get_running_loop()
+    background = await DATA_GAME.start()
+    background.append(asyncio.create_task(AI_POOL.run()))
+    background.append(asyncio.create_task(
+        receive_invalidations(invalidations[index], DATA_GAME.users)
+    ))
+    tasks: set[asyncio.Task] = set()
+    handled = 0
+    logger.info(f"Worker {index} started")
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            # Обновления обрабатываются параллельно, как при start_polling
+            task = asyncio.create_task(dp.feed_raw_update(bot, raw))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            handled += 1
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await DATA_GAME.close(background)
+        AI_POOL.shutdown()
+        await bot.session.close()
+        logger.info(f"Worker {index} stopped after {handled} updates")
+
+
+async def poll_updates(bot: Bot, queues: list[multiprocessing.Queue]):
+    """Получает обновления и раздаёт их воркерам"""
+    loop = asyncio.get_running_loop()
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    while True:
+        updates = await bot.get_updates(offset=offset, timeout=30)
+        for update in updates:
+            offset = update.update_id + 1
+            queue = queues[worker_of(update, len(queues))]
+            raw = update.model_dump(mode="json", exclude_none=True)
+            await loop.run_in_executor(None, queue.put, raw)
+
+
+def run(workers: int):
+    """Запускает воркеров и раздаёт им обновления до остановки"""
+    logging.config.dictConfig(LOGGING_CONFIG)
+    if STORAGE_BACKEND != "sqlite":
+        raise ValueError(
+            f"STORAGE_BACKEND={STORAGE_BACKEND} keeps users inside one process, "
+            f"BOT_WORKERS > 1 needs the shared sqlite backend"
+        )
+    # spawn: воркеры не наследуют открытые соединения с базой
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(QUEUE_SIZE) for _ in range(workers)]
+    invalidations = [context.Queue() for _ in range(workers)]
+    processes = []
+    # Номер воркера передаётся через окружение, чтобы конфиг
+    # дочернего процесса прочитал его при импорте
+    os.environ["BOT_WORKERS"] = str(workers)
+    for index, queue in enumerate(queues):
+        os.environ["WORKER_INDEX"] = str(index)
+        process = context.Process(target=worker_main, args=(index, queue, invalidations),
+                                  name=f"bot-worker-{index}")
+        process.start()
+        processes.append(process)
+    os.environ["WORKER_INDEX"] = "0"
+    logger.info(f"Started {workers} bot workers")
+
+    async def front():
+        bot = Bot(token=BOT_TOKEN)
+        try:
+            await poll_updates(bot, queues)
+        finally:
+            await bot.session.close()
+
+    try:
+        asyncio.run(front())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
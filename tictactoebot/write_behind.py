@@ -0,0 +1,220 @@
+"""
+Отложенная запись пользователей, настроек и счёта.
+
+Изменения копятся в памяти по пользователю: для настроек
+остаётся последнее значение, приращения счёта складываются.
+Всё накопленное пишется одной транзакцией раз в WRITE_BEHIND_INTERVAL_MS
+или когда набралось WRITE_BEHIND_MAX_RECORDS изменений, и при остановке бота.
+
+Пока пачка пишется, пользователь может быть прочитан из базы заново.
+Поэтому последние пачки хранятся с номерами: чтение знает, сколько пачек
+уже было в базе, и накладывает изменения из более поздних (changes_after).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .config import WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_RECORDS
+from .storage import Storage
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class PendingUser:
+    chat_id: int
+    is_new: bool = False
+    language: Optional[str] = None
+    difficulty: Optional[str] = None
+    player: int = 0
+    bot: int = 0
+    enemy: int = 0
+    draw: int = 0
+    name: Optional[str] = None
+
+    def to_tuple(self) -> tuple:
+        return (
+            self.chat_id, self.is_new, self.language, self.difficulty,
+            self.player, self.bot, self.enemy, self.draw, self.name,
+        )
+
+    def apply(self, user):
+        """Накладывает незаписанные изменения на пользователя, прочитанного из базы"""
+        if self.language is not None:
+            user.language = self.language
+        if self.difficulty is not None:
+            user.difficulty = self.difficulty
+        if self.name is not None:
+            user.name = self.name
+        user.score.player += self.player
+        user.score.bot += self.bot
+        user.score.enemy += self.enemy
+        user.score.draw += self.draw
+
+
+class WriteBehind:
+    LATENCY_WINDOW = 1000
+    RETAINED_BATCHES = 64
+
+    def __init__(self, db: Storage,
+                 interval_ms: int = WRITE_BEHIND_INTERVAL_MS,
+                 max_records: int = WRITE_BEHIND_MAX_RECORDS):
+        self.db = db
+        self.interval = interval_ms / 1000
+        self.max_records = max_records
+        self.pending: dict[int, PendingUser] = {}
+        self.records = 0
+        self.flushing: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.batches: deque[tuple[int, dict[int, PendingUser]]] = deque()
+        # Номер последней пачки, вытесненной из batches
+        self.forgotten = 0
+        # Вызывается с chat_id записанной пачки после её фиксации (см. workers.py)
+        self.on_written: Optional[Callable[[list[int]], None]] = None
+
+        self.flushes = 0
+        self.written_records = 0
+        self.written_users = 0
+        self.errors = 0
+        self.batch_sizes: deque[int] = deque(maxlen=self.LATENCY_WINDOW)
+        self.latencies: deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self.pending
+
+    def get(self, chat_id: int) -> Optional[PendingUser]:
+        return self.pending.get(chat_id)
+
+    def changes_after(self, chat_id: int, applied: int) -> Optional[list[PendingUser]]:
+        """
+        Изменения пользователя, которых нет в базе после applied пачек.
+        None, если нужные пачки уже забыты и пользователя надо прочитать снова
+        """
+        if applied < self.forgotten:
+            return None
+        changes = [
+            batch[chat_id] for seq, batch in self.batches
+            if seq > applied and chat_id in batch
+        ]
+        if chat_id in self.pending:
+            changes.append(self.pending[chat_id])
+        return changes
+
+    def _pending(self, chat_id: int) -> PendingUser:
+        entry = self.pending.get(chat_id)
+        if entry is None:
+            entry = self.pending[chat_id] = PendingUser(chat_id)
+        self.records += 1
+        if self.records >= self.max_records and self.flushing is None:
+            self.flushing = asyncio.get_running_loop().create_task(self.flush())
+            self.flushing.add_done_callback(self._flushed)
+        return entry
+
+    def _flushed(self, task: asyncio.Task):
+        self.flushing = None
+
+    def add_user(self, chat_id: int):
+        self._pending(chat_id).is_new = True
+
+    def set_language(self, chat_id: int, language: str):
+        self._pending(chat_id).language = language
+
+    def set_difficulty(self, chat_id: int, difficulty: str):
+        self._pending(chat_id).difficulty = difficulty
+
+    def set_name(self, chat_id: int, name: str):
+        self._pending(chat_id).name = name
+
+    def add_score(self, chat_id: int, player: int = 0, bot: int = 0,
+                  enemy: int = 0, draw: int = 0):
+        entry = self._pending(chat_id)
+        entry.player += player
+        entry.bot += bot
+        entry.enemy += enemy
+        entry.draw += draw
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        records, self.records = self.records, 0
+        rows = [entry.to_tuple() for entry in pending.values()]
+        self.submitted += 1
+        batch = (self.submitted, pending)
+        if len(self.batches) >= self.RETAINED_BATCHES:
+            self.forgotten = self.batches.popleft()[0]
+        self.batches.append(batch)
+        started = time.perf_counter()
+        # Пачка уходит в поток базы сразу, в том же шаге цикла, что и обмен pending
+        future = self.db.submit_batch(rows, self.submitted)
+        try:
+            await asyncio.shield(future)
+        except Exception:
+            self.errors += 1
+            logger.exception(f"Failed to write {len(rows)} users, will retry")
+            if batch in self.batches:
+                self.batches.remove(batch)
+            # Более новые изменения уже могли попасть в pending
+            for entry in pending.values():
+                self._merge(entry)
+            self.records += records
+            return 0
+        self.latencies.append(time.perf_counter() - started)
+        self.batch_sizes.append(len(rows))
+        self.flushes += 1
+        self.written_records += records
+        self.written_users += len(rows)
+        if self.on_written is not None:
+            self.on_written(list(pending))
+        return len(rows)
+
+    def _merge(self, old: PendingUser):
+        new = self.pending.get(old.chat_id)
+        if new is None:
+            self.pending[old.chat_id] = old
+            return
+        new.is_new = new.is_new or old.is_new
+        new.language = new.language if new.language is not None else old.language
+        new.difficulty = new.difficulty if new.difficulty is not None else old.difficulty
+        new.name = new.name if new.name is not None else old.name
+        new.player += old.player
+        new.bot += old.bot
+        new.enemy += old.enemy
+        new.draw += old.draw
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def close(self):
+        if self.flushing is not None:
+            await self.flushing
+        await self.flush()
+        logger.info(f"Write-behind stats: {self.stats()}")
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "pending_users": len(self.pending),
+            "pending_records": self.records,
+            "flushes": self.flushes,
+            "written_records": self.written_records,
+            "written_users": self.written_users,
+            "errors": self.errors,
+            "avg_batch_size": round(sum(self.batch_sizes) / len(self.batch_sizes), 1)
+            if self.batch_sizes else 0.0,
+            "max_batch_size": max(self.batch_sizes, default=0),
+            "flush_p50_ms": percentile(0.5),
+            "flush_p99_ms": percentile(0.99),
+        }